@@ -1,20 +1,24 @@
-from fastapi import FastAPI, UploadFile, File, Form, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, UploadFile, File, Form, WebSocket, WebSocketDisconnect, Request
+from fastapi.responses import HTMLResponse, ORJSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-from openai import OpenAI
+from fastapi.middleware.gzip import GZipMiddleware
+from openai import AsyncOpenAI
 from pypdf import PdfReader
+import pypdfium2 as pdfium
 import uvicorn
 import tempfile
 import os
-import json
+import io
+import orjson
 import asyncio
+import hashlib
 from datetime import datetime
 from typing import Dict, List, Optional
-from collections import deque
-from services.a365_integration import push_to_a365
+from collections import deque, OrderedDict
+from services.a365_integration import push_to_a365_async
 from services.guardrails import GuardrailEngine
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 guardrails = GuardrailEngine()
 
 @app.post("/api/a365/push")
@@ -24,7 +28,8 @@ async def a365_push_endpoint(payload: dict):
         tasks = payload.get("tasks", [])
         tags = payload.get("tags", [])
         
-        result = push_to_a365(summary, tasks, tags)
+        # Worker thread: request-window pacing blocks and must not stall the event loop
+        result = await push_to_a365_async(summary, tasks, tags)
         
         return {
             "status": "success",
@@ -51,7 +56,9 @@ async def reset_guardrails():
     guardrails.reset()
     return {"status": "reset"}
 
-client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+# Async client — the handlers are async def, so a sync call here would block the event loop
+# (and every other in-flight request) for the full duration of each OpenAI round-trip
+client = AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
 
 app.add_middleware(
     CORSMiddleware,
@@ -61,79 +68,189 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress the index page and larger JSON bodies (history, summaries); tiny responses
+# are left alone since gzip framing would outweigh the savings
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+
 active_sessions: Dict[str, Dict] = {}
-client_info: Dict[str, str] = {}
+# LRU of uploaded client context — bounded so repeated uploads across many clients
+# can't grow process memory without limit
+CLIENT_INFO_MAX = 32
+client_info: "OrderedDict[str, str]" = OrderedDict()
 conversation_history: List[Dict] = []
 current_call_transcript: List[Dict] = []
 
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+PDF_MAGIC = b"%PDF-"
+# Readers accept the header anywhere in the first 1024 bytes (after a short preamble)
+PDF_HEADER_SEARCH_BYTES = 1024
+
+# Map an audio upload's leading bytes to the file extension Whisper expects
+def _sniff_audio_ext(head: bytes) -> str:
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return ".wav"
+    if head[:3] == b"ID3" or (len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0):
+        return ".mp3"
+    if head[4:8] == b"ftyp":
+        return ".m4a"
+    # MediaRecorder default (EBML header 1A 45 DF A3) and anything unrecognised
+    return ".webm"
+
+# Exact-match cache for /analyze_conversation — repeated analysis of an unchanged
+# transcript + client context returns the previous result without an OpenAI round-trip
+ANALYSIS_CACHE_SIZE = 256
+analysis_cache: "OrderedDict[str, Dict]" = OrderedDict()
+
+# Extracted PDF text keyed by content hash — re-uploading the same file (or the same
+# deck for several clients) skips the parse entirely
+PDF_TEXT_CACHE_SIZE = 32
+pdf_text_cache: "OrderedDict[str, str]" = OrderedDict()
+
+def _content_hash(data: bytes) -> str:
+    # blake2b is in hashlib and faster than sha256 in software; 128 bits is ample for cache keys
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def _analysis_cache_key(messages: List[Dict]) -> str:
+    return _content_hash(orjson.dumps(messages, option=orjson.OPT_SORT_KEYS))
+
+# index.html is static — read it once and serve the cached copy; the mtime check keeps
+# edits visible during development without re-reading the file on every page load.
+# An ETag lets repeat loads revalidate to an empty 304 instead of re-downloading. It is
+# weak: GZipMiddleware may send the same page identity- or gzip-coded, and a strong
+# validator would have to differ between the two encodings.
+_index_cache: Dict[str, object] = {"mtime": None, "html": None, "etag": None}
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison (what If-None-Match uses): W/ prefixes are ignored, lists and * allowed."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if (tag[2:] if tag.startswith("W/") else tag) == opaque:
+            return True
+    return False
+
 @app.get("/")
-def serve_index():
+def serve_index(request: Request):
     try:
-        with open("index.html", "r", encoding="utf-8") as f:
-            return HTMLResponse(f.read())
+        mtime = os.stat("index.html").st_mtime
+        if _index_cache["mtime"] != mtime:
+            with open("index.html", "rb") as f:
+                raw = f.read()
+            _index_cache["html"] = raw.decode("utf-8")
+            _index_cache["etag"] = f'W/"{_content_hash(raw)}"'
+            _index_cache["mtime"] = mtime
+        
+        headers = {"ETag": _index_cache["etag"], "Cache-Control": "no-cache"}
+        if _etag_matches(request.headers.get("if-none-match"), _index_cache["etag"]):
+            return Response(status_code=304, headers=headers)
+        return HTMLResponse(_index_cache["html"], headers=headers)
     except FileNotFoundError:
         return HTMLResponse("<h1>Error: index.html not found</h1>")
 
+def _extract_pdf_text(content: bytes) -> str:
+    # Parsed from memory in a worker thread — PDF decoding is CPU-bound and would
+    # otherwise stall the event loop (and every in-flight transcription)
+    try:
+        return _extract_pdf_text_pdfium(content)
+    except Exception:
+        # PDFium rejects some malformed files that pypdf can still recover
+        pass
+    
+    reader = PdfReader(io.BytesIO(content))
+    text_parts = []
+    for page in reader.pages:
+        text = page.extract_text()
+        if text:
+            text_parts.append(text)
+    return "\n\n".join(text_parts)
+
+def _extract_pdf_text_pdfium(content: bytes) -> str:
+    # PDFium (native C++) is several times faster than pypdf's pure-Python text layer
+    pdf = pdfium.PdfDocument(content)
+    try:
+        text_parts = []
+        for page in pdf:
+            textpage = page.get_textpage()
+            text = textpage.get_text_range()
+            textpage.close()
+            page.close()
+            if text:
+                text_parts.append(text)
+        return "\n\n".join(text_parts)
+    finally:
+        pdf.close()
+
 @app.post("/upload_client_info")
 async def upload_client_info(file: UploadFile = File(None), client_name: str = Form(None), client_notes: str = Form(None)):
     global client_info
     
     try:
         client_id = client_name or "default_client"
-        client_context = ""
-        
-        if file and file.filename.lower().endswith('.pdf'):
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-                content = await file.read()
-                tmp.write(content)
-                tmp_path = tmp.name
-            
-            reader = PdfReader(tmp_path)
-            text_parts = []
-            for page in reader.pages:
-                text = page.extract_text()
-                if text:
-                    text_parts.append(text)
-            
-            client_context = "\n\n".join(text_parts)
-            os.unlink(tmp_path)
+        context_parts = []
+        
+        # Sniff the PDF signature instead of trusting the filename — an image or other
+        # file renamed to .pdf never reaches the PDF parser
+        content = await file.read() if file else b""
+        if content and PDF_MAGIC not in content[:PDF_HEADER_SEARCH_BYTES]:
+            return ORJSONResponse(
+                {"status": "error", "message": "Unsupported file type: expected a PDF"},
+                status_code=400,
+            )
+        if content:
+            pdf_key = _content_hash(content)
+            pdf_text = pdf_text_cache.get(pdf_key)
+            if pdf_text is None:
+                pdf_text = await asyncio.to_thread(_extract_pdf_text, content)
+                pdf_text_cache[pdf_key] = pdf_text
+                if len(pdf_text_cache) > PDF_TEXT_CACHE_SIZE:
+                    pdf_text_cache.popitem(last=False)
+            else:
+                pdf_text_cache.move_to_end(pdf_key)
+            context_parts.append(pdf_text)
         
         if client_notes:
-            client_context += f"\n\nAdditional Notes:\n{client_notes}"
+            context_parts.append(f"\n\nAdditional Notes:\n{client_notes}")
         
-        client_info[client_id] = client_context
+        client_info[client_id] = "".join(context_parts)
+        client_info.move_to_end(client_id)
+        if len(client_info) > CLIENT_INFO_MAX:
+            client_info.popitem(last=False)
         
-        return JSONResponse({
+        return ORJSONResponse({
             "status": "success",
             "message": f"Client information loaded for {client_id}",
             "client_id": client_id
         })
         
     except Exception as e:
-        return JSONResponse({"status": "error", "message": f"Failed to process client info: {str(e)}"})
+        return ORJSONResponse({"status": "error", "message": f"Failed to process client info: {str(e)}"})
 
 @app.post("/transcribe_audio")
 async def transcribe_audio(file: UploadFile = File(...)):
     tmp_path = None
     try:
-        file_ext = ".webm"
-        if file.filename:
-            if file.filename.endswith('.wav'):
-                file_ext = ".wav"
-            elif file.filename.endswith('.mp3'):
-                file_ext = ".mp3"
-            elif file.filename.endswith('.m4a'):
-                file_ext = ".m4a"
+        # Pick the container from the upload's magic bytes rather than the client-supplied
+        # filename, so Whisper is told the real format even for mislabelled uploads
+        head = await file.read(UPLOAD_CHUNK_SIZE)
+        if not head:
+            return ORJSONResponse({"status": "error", "message": "Empty audio file"})
+        file_ext = _sniff_audio_ext(head)
         
+        # Copy the upload to disk in fixed-size chunks instead of holding the whole
+        # recording in memory just to write it back out
         with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as tmp:
-            content = await file.read()
-            if len(content) == 0:
-                return JSONResponse({"status": "error", "message": "Empty audio file"})
-            tmp.write(content)
             tmp_path = tmp.name
+            tmp.write(head)
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                tmp.write(chunk)
         
         with open(tmp_path, "rb") as audio_file:
-            transcription = client.audio.transcriptions.create(
+            transcription = await client.audio.transcriptions.create(
                 model="whisper-1",
                 file=audio_file,
                 language="en",
@@ -149,9 +266,9 @@ async def transcribe_audio(file: UploadFile = File(...)):
         text = transcription.text.strip() if hasattr(transcription, 'text') and transcription.text else str(transcription).strip()
         
         if not text:
-            return JSONResponse({"status": "error", "message": "No transcription text received"})
+            return ORJSONResponse({"status": "error", "message": "No transcription text received"})
         
-        return JSONResponse({
+        return ORJSONResponse({
             "status": "success",
             "text": text
         })
@@ -162,7 +279,7 @@ async def transcribe_audio(file: UploadFile = File(...)):
                 os.unlink(tmp_path)
             except:
                 pass
-        return JSONResponse({"status": "error", "message": f"Transcription failed: {str(e)}"})
+        return ORJSONResponse({"status": "error", "message": f"Transcription failed: {str(e)}"})
 
 @app.post("/submit_transcript")
 async def submit_transcript(text: str = Form(...)):
@@ -181,7 +298,7 @@ async def submit_transcript(text: str = Form(...)):
         "timestamp": timestamp
     })
     
-    return JSONResponse({"status": "success"})
+    return ORJSONResponse({"status": "success"})
 
 @app.post("/analyze_conversation")
 async def analyze_conversation(client_id: str = Form("default_client")):
@@ -189,7 +306,7 @@ async def analyze_conversation(client_id: str = Form("default_client")):
     
     try:
         if not current_call_transcript:
-            return JSONResponse({
+            return ORJSONResponse({
                 "status": "success",
                 "message": "No transcript to analyze yet"
             })
@@ -218,30 +335,48 @@ Your response MUST be in JSON format:
 Even for normal conversation, provide brief helpful context. Only leave fields empty if the transcript is truly unclear or just noise."""
         
         context_text = ""
-        if client_id in client_info and client_info[client_id]:
+        if client_id in client_info:
+            client_info.move_to_end(client_id)
+        if client_info.get(client_id):
             context_preview = client_info[client_id][:2000]
             context_text = f"\n\nCLIENT CONTEXT:\n{context_preview}\n"
         
+        # Client context is stable for the whole call, so it goes in the system message
+        # ahead of the moving transcript window — keeps the prompt prefix identical turn
+        # to turn so the provider can reuse its cached prefill for this client
         user_message = f"""Here's the recent conversation transcript:
 {recent_transcript}
-{context_text}
+
 Analyze this conversation and provide helpful, actionable suggestions. What's happening? What should the sales rep be aware of or consider saying next? Be helpful and proactive."""
         
-        response = client.chat.completions.create(
+        messages = [
+            {"role": "system", "content": system_message + context_text},
+            {"role": "user", "content": user_message}
+        ]
+        cache_key = _analysis_cache_key(messages)
+        
+        if cache_key in analysis_cache:
+            analysis_cache.move_to_end(cache_key)
+            return ORJSONResponse({
+                "status": "success",
+                "analysis": analysis_cache[cache_key],
+                "timestamp": datetime.now().isoformat(),
+                "cached": True
+            })
+        
+        response = await client.chat.completions.create(
             model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": user_message}
-            ],
+            messages=messages,
             max_tokens=400,
             temperature=0.8,
-            response_format={"type": "json_object"}
+            response_format={"type": "json_object"},
+            extra_body={"prompt_cache_key": f"analyze:{client_id}"}
         )
         
         try:
             analysis_content = response.choices[0].message.content
-            analysis = json.loads(analysis_content)
-        except json.JSONDecodeError:
+            analysis = orjson.loads(analysis_content)
+        except orjson.JSONDecodeError:
             analysis = {
                 "suggestion": analysis_content[:200] if analysis_content else "Analysis completed",
                 "key_points": [],
@@ -249,14 +384,18 @@ Analyze this conversation and provide helpful, actionable suggestions. What's ha
                 "insight_type": "response_suggestion"
             }
         
-        return JSONResponse({
+        analysis_cache[cache_key] = analysis
+        if len(analysis_cache) > ANALYSIS_CACHE_SIZE:
+            analysis_cache.popitem(last=False)
+        
+        return ORJSONResponse({
             "status": "success",
             "analysis": analysis,
             "timestamp": datetime.now().isoformat()
         })
         
     except Exception as e:
-        return JSONResponse({
+        return ORJSONResponse({
             "status": "error",
             "message": f"Analysis failed: {str(e)}"
         })
@@ -266,7 +405,7 @@ async def clear_context():
     global conversation_history, current_call_transcript
     conversation_history = []
     current_call_transcript = []
-    return JSONResponse({"status": "success", "message": "Context cleared"})
+    return ORJSONResponse({"status": "success", "message": "Context cleared"})
 
 @app.post("/start_call")
 async def start_call(client_id: str = Form("default_client")):
@@ -278,7 +417,7 @@ async def start_call(client_id: str = Form("default_client")):
         "start_time": datetime.now().isoformat(),
         "transcript": []
     }
-    return JSONResponse({
+    return ORJSONResponse({
         "status": "success",
         "call_id": call_id,
         "message": "Call session started"
@@ -301,7 +440,7 @@ TRANSCRIPT:
 {full_transcript[:4000]}
 Provide a concise summary in bullet format."""
         
-        summary_response = client.chat.completions.create(
+        summary_response = await client.chat.completions.create(
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": "You are a sales analytics AI. Provide clear, actionable call summaries."},
@@ -317,18 +456,18 @@ Provide a concise summary in bullet format."""
             active_sessions[call_id]["end_time"] = datetime.now().isoformat()
             active_sessions[call_id]["summary"] = summary
         
-        return JSONResponse({
+        return ORJSONResponse({
             "status": "success",
             "summary": summary,
             "transcript_length": len(current_call_transcript)
         })
         
     except Exception as e:
-        return JSONResponse({"status": "error", "message": str(e)})
+        return ORJSONResponse({"status": "error", "message": str(e)})
 
 @app.get("/get_history")
 async def get_history():
-    return JSONResponse({
+    return ORJSONResponse({
         "status": "success",
         "history": conversation_history,
         "has_context": bool(client_info)
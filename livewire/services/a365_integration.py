@@ -3,45 +3,97 @@ a365_integration.py — WS5 CRM Push Pipeline
 Updated for P1-WS5.3: IdempotencyTracker is now wired into push_to_a365_with_retry.
 """
 
+import asyncio
+import functools
 import logging
 import os
 import requests
+import time
 import uuid
+from collections import deque
+from requests.adapters import HTTPAdapter
 from datetime import datetime
+from typing import Optional
 
-from rate_limit_handler import RateLimitHandler
-from idempotency_tracker import IdempotencyTracker
-from payload_validator import validate_payload, generate_idempotency_key, ValidationError
+from .rate_limit_handler import RateLimitHandler, SlidingWindowLimiter, parse_retry_after
+from .idempotency_tracker import IdempotencyTracker
+from .payload_validator import validate_payload, generate_idempotency_key, ValidationError
 
 logger = logging.getLogger(__name__)
 
 GHL_API_KEY = os.environ.get("GHL_API_KEY")
+# GHL allows 100 requests per 10s burst window — pace just under it by default
+GHL_RPS = float(os.environ.get("GHL_RPS", "9"))
+GHL_BURST = int(os.environ.get("GHL_BURST", "90"))
+GHL_BATCH_URL = "https://api.ghl.com/contacts/notes:batch"
+# Set after the bulk endpoint answers 404/405/501; batches then go straight to per-item pushes
+_bulk_endpoint_unsupported = False
 _rate_limiter = RateLimitHandler(max_retries=5, base_delay=2.0)
-_idempotency_tracker = IdempotencyTracker()
+# Where pushes are recorded; tests point this at a temp dir before importing the module
+IDEMPOTENCY_DB_PATH = os.environ.get("LIVEWIRE_IDEMPOTENCY_DB", "livewire_idempotency.db")
+_idempotency_tracker = IdempotencyTracker(IDEMPOTENCY_DB_PATH)
+_request_window = SlidingWindowLimiter(max_requests=GHL_BURST, period=GHL_BURST / GHL_RPS)
+
+# Shared keep-alive session — repeat pushes (and backoff retries) reuse the pooled
+# TLS connection to GHL instead of paying a fresh handshake per request
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=0))
+_session.headers.update({
+    "Authorization": f"Bearer {GHL_API_KEY}",
+    "Content-Type": "application/json"
+})
+
+
+# Pre-sized payload shape — copying it skips rebuilding the dict on every push/retry
+_PAYLOAD_TEMPLATE = {
+    "note": None,
+    "action_items": None,
+    "categories": None,
+    "timestamp": None,
+    "source": "livewire",
+    "contact_id": None
+}
+
+
+# (epoch second, ISO string) — pushes within the same second share one formatted timestamp
+_ts_cache = (0, "")
+
+
+def _now_iso() -> str:
+    """Second-resolution ISO timestamp, formatted at most once per second."""
+    global _ts_cache
+    now = int(time.time())
+    cached = _ts_cache
+    if cached[0] != now:
+        cached = (now, datetime.fromtimestamp(now).isoformat())
+        _ts_cache = cached
+    return cached[1]
+
+
+def _build_payload(summary: str, tasks: list, tags: list, contact_id: str = None) -> dict:
+    payload = _PAYLOAD_TEMPLATE.copy()
+    payload["note"] = summary
+    payload["action_items"] = tasks
+    payload["categories"] = tags
+    payload["timestamp"] = _now_iso()
+    payload["contact_id"] = contact_id
+    return payload
 
 
 def push_to_a365(summary: str, tasks: list, tags: list, contact_id: str = None) -> dict:
     """Push to A365/GHL with rate limit handling."""
-    payload = {
-        "note": summary,
-        "action_items": tasks,
-        "categories": tags,
-        "timestamp": datetime.now().isoformat(),
-        "source": "livewire",
-        "contact_id": contact_id
-    }
+    payload = _build_payload(summary, tasks, tags, contact_id)
 
     if not GHL_API_KEY:
-        logger.info(f"[MOCK] Would push to A365: {payload}")
+        # %r is formatted lazily; the guard skips even the call when INFO is off
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("[MOCK] Would push to A365: %r", payload)
         return {"status": "success", "mock": True, "payload": payload}
 
     try:
-        response = requests.post(
+        _request_window.acquire()
+        response = _session.post(
             f"https://api.ghl.com/contacts/{contact_id}/notes",
-            headers={
-                "Authorization": f"Bearer {GHL_API_KEY}",
-                "Content-Type": "application/json"
-            },
             json=payload,
             timeout=10
         )
@@ -50,7 +102,8 @@ def push_to_a365(summary: str, tasks: list, tags: list, contact_id: str = None)
             return {
                 "status_code": 429,
                 "error": "Rate limit exceeded",
-                "error_type": "rate_limit"
+                "error_type": "rate_limit",
+                "retry_after": _retry_after_seconds(response.headers)
             }
 
         if response.status_code >= 400:
@@ -67,6 +120,22 @@ def push_to_a365(summary: str, tasks: list, tags: list, contact_id: str = None)
         return {"status": "error", "error": str(e)}
 
 
+def _retry_after_seconds(headers) -> Optional[float]:
+    """Seconds until GHL accepts requests again, from Retry-After or X-RateLimit-Reset (epoch)."""
+    retry_after = parse_retry_after(headers.get("Retry-After"))
+    if retry_after is not None:
+        return retry_after
+
+    reset_at = headers.get("X-RateLimit-Reset")
+    if reset_at is not None:
+        try:
+            return max(0.0, float(reset_at) - time.time())
+        except ValueError:
+            pass
+
+    return None
+
+
 def push_to_a365_with_retry(
     session_id: str,
     contact_id: str,
@@ -89,7 +158,244 @@ def push_to_a365_with_retry(
     Calling this function twice with identical arguments will execute the push
     exactly once; the second call returns the cached success result immediately.
     """
+    skipped, keys = _begin_push(
+        session_id, contact_id, summary, tasks, tags, artifact_type, artifact_id
+    )
+    if skipped is not None:
+        return skipped
+
+    # ── Step 4: Execute push ──────────────────────────────────────────────────
+    result = _rate_limiter.execute_with_backoff(
+        push_to_a365,
+        summary=summary,
+        tasks=tasks,
+        tags=tags,
+        contact_id=contact_id,
+    )
+
+    return _finish_push(result, session_id, tasks, tags, *keys)
+
+
+async def push_to_a365_async(summary: str, tasks: list, tags: list, contact_id: str = None) -> dict:
+    """Run push_to_a365 in a worker thread so the event loop stays free during the HTTP call."""
+    return await asyncio.to_thread(push_to_a365, summary, tasks, tags, contact_id)
+
+
+async def push_to_a365_with_retry_async(
+    session_id: str,
+    contact_id: str,
+    summary: str,
+    tasks: list,
+    tags: list,
+    artifact_type: str = "full_push",
+    artifact_id: str = None,
+) -> dict:
+    """
+    Async variant of push_to_a365_with_retry for callers on an event loop.
+
+    Same validation and idempotency steps, but backoff waits use asyncio.sleep,
+    so a rate-limited session does not stall pushes for other sessions.
+    """
+    skipped, keys = _begin_push(
+        session_id, contact_id, summary, tasks, tags, artifact_type, artifact_id
+    )
+    if skipped is not None:
+        return skipped
+
+    # ── Step 4: Execute push ──────────────────────────────────────────────────
+    result = await _rate_limiter.execute_with_backoff_async(
+        push_to_a365_async,
+        summary=summary,
+        tasks=tasks,
+        tags=tags,
+        contact_id=contact_id,
+    )
+
+    return _finish_push(result, session_id, tasks, tags, *keys)
+
+
+def push_batch_to_a365(items: list) -> list:
+    """
+    Push many sessions' notes to GHL in one bulk HTTP call.
+
+    Each item is a dict with session_id, contact_id, summary, tasks, tags and
+    optional artifact_type / artifact_id — the push_to_a365_with_retry arguments.
+    Validation and duplicate checks run for every item before anything is sent,
+    so duplicates never reach the wire; the rest share one request and one
+    request-window slot. A 207 Multi-Status reply is mapped back to per-item
+    results by contact_id. If the bulk endpoint is unavailable, the remaining
+    items are pushed one by one — and so are all later batches in this process.
+
+    Returns one push_to_a365_with_retry-shaped result per item, in input order.
+    """
+    global _bulk_endpoint_unsupported
+    results = [None] * len(items)
+    pending = []
+    in_flight = set()
+
+    for i, item in enumerate(items):
+        skipped, keys = _begin_push(
+            item["session_id"],
+            item["contact_id"],
+            item["summary"],
+            item.get("tasks", []),
+            item.get("tags", []),
+            item.get("artifact_type", "full_push"),
+            item.get("artifact_id"),
+            in_flight=in_flight,
+        )
+        if skipped is not None:
+            results[i] = skipped
+        else:
+            pending.append((i, item, keys))
+
+    if not pending:
+        return results
+
+    payloads = [
+        _build_payload(item["summary"], item.get("tasks", []), item.get("tags", []), item["contact_id"])
+        for _, item, _ in pending
+    ]
+
+    if not GHL_API_KEY:
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("[MOCK] Would batch-push %d notes to A365", len(payloads))
+        outcomes = [
+            {"status": "success", "data": {"status": "success", "mock": True, "payload": payload}, "attempts": 1}
+            for payload in payloads
+        ]
+    else:
+        batch = None
+        if not _bulk_endpoint_unsupported:
+            batch = _rate_limiter.execute_with_backoff(_post_batch, payloads)
+            if batch["status"] == "success" and batch["data"].get("unsupported"):
+                # Remembered for the process, so later batches don't each pay a failing
+                # POST and a request-window slot before falling back
+                logger.warning("Bulk notes endpoint unavailable — pushing items sequentially from now on")
+                _bulk_endpoint_unsupported = True
+        if _bulk_endpoint_unsupported:
+            outcomes = [
+                _rate_limiter.execute_with_backoff(
+                    push_to_a365,
+                    summary=item["summary"],
+                    tasks=item.get("tasks", []),
+                    tags=item.get("tags", []),
+                    contact_id=item["contact_id"],
+                )
+                for _, item, _ in pending
+            ]
+        elif batch["status"] == "success":
+            outcomes = _demux_batch_results(batch, [item["contact_id"] for _, item, _ in pending])
+        else:
+            outcomes = [batch] * len(pending)
+
+    for (i, item, keys), outcome in zip(pending, outcomes):
+        results[i] = _finish_push(
+            outcome, item["session_id"], item.get("tasks", []), item.get("tags", []), *keys
+        )
+
+    return results
+
+
+def _post_batch(payloads: list) -> dict:
+    """One POST to the bulk notes endpoint; result shape matches push_to_a365."""
+    try:
+        _request_window.acquire()
+        response = _session.post(GHL_BATCH_URL, json=payloads, timeout=30)
+
+        if response.status_code == 429:
+            return {
+                "status_code": 429,
+                "error": "Rate limit exceeded",
+                "error_type": "rate_limit",
+                "retry_after": _retry_after_seconds(response.headers)
+            }
+
+        if response.status_code in (404, 405, 501):
+            return {"status": "success", "unsupported": True}
+
+        if response.status_code >= 400:
+            return {
+                "status": "error",
+                "error": f"HTTP {response.status_code}: {response.text}"
+            }
+
+        return {"status": "success", "status_code": response.status_code, "data": response.json()}
+
+    except requests.exceptions.Timeout:
+        return {"status": "error", "error": "Request timeout"}
+    except Exception as e:
+        return {"status": "error", "error": str(e)}
+
+
+def _demux_batch_results(batch: dict, contact_ids: list) -> list:
+    """
+    Split a bulk response into per-item outcomes shaped like execute_with_backoff results.
 
+    Expects {"results": [{"contact_id": ..., "status": <http code>, ...}, ...]}; entries
+    for the same contact are consumed in request order.
+    """
+    attempts = batch.get("attempts", 1)
+    body = batch["data"].get("data")
+    entries = body.get("results") if isinstance(body, dict) else None
+    if not isinstance(entries, list):
+        # Unexpected shape: fail every item so its in_progress record is marked failed
+        error = f"unexpected bulk response body: {type(body).__name__}"
+        return [{
+            "status": "error",
+            "message": "Malformed bulk response",
+            "attempts": attempts,
+            "last_error": error
+        } for _ in contact_ids]
+
+    by_contact = {}
+    for entry in entries:
+        if isinstance(entry, dict):
+            by_contact.setdefault(entry.get("contact_id"), deque()).append(entry)
+
+    outcomes = []
+    for contact_id in contact_ids:
+        queue = by_contact.get(contact_id)
+        entry = queue.popleft() if queue else None
+        if entry is None:
+            outcomes.append({
+                "status": "error",
+                "message": "No result for item in bulk response",
+                "attempts": attempts,
+                "last_error": f"missing result for contact {contact_id}"
+            })
+            continue
+        try:
+            item_status = int(entry.get("status", 200))
+        except (TypeError, ValueError):
+            item_status = None
+        if item_status is None or item_status >= 400:
+            outcomes.append({
+                "status": "error",
+                "message": f"Bulk item failed with HTTP {entry.get('status')}",
+                "attempts": attempts,
+                "last_error": str(entry.get("error", entry.get("status")))
+            })
+        else:
+            outcomes.append({
+                "status": "success",
+                "data": {"status": "success", "data": entry},
+                "attempts": attempts
+            })
+    return outcomes
+
+
+def _begin_push(session_id, contact_id, summary, tasks, tags, artifact_type, artifact_id,
+                in_flight: set = None):
+    """
+    Steps 1–3 of a guarded push: validate, check idempotency, record in_progress.
+
+    `in_flight` collects dedupe keys already claimed by the current batch, so a
+    repeated item within one batch is skipped like a completed duplicate.
+
+    Returns (response, None) when the push must not run (invalid or duplicate),
+    otherwise (None, (idempotency_key, dedupe_key)).
+    """
     # ── Step 1: Validate ─────────────────────────────────────────────────────
     raw_payload = {
         "session_id": session_id,
@@ -105,7 +411,8 @@ def push_to_a365_with_retry(
     try:
         validated = validate_payload(raw_payload)
     except ValidationError as e:
-        logger.error(f"[{session_id}] Payload validation failed: {e.errors}")
+        logger.error("[%s] Payload validation failed: %s", session_id, e.errors,
+                     extra={"session_id": session_id})
         return {
             "status": "error",
             "error_type": "validation_error",
@@ -113,7 +420,7 @@ def push_to_a365_with_retry(
             "session_id": session_id,
             "retryable": False,
             "visible_to_user": "Push rejected: invalid payload — fix errors and retry",
-        }
+        }, None
 
     resolved_artifact_id = validated.get("artifact_id")
 
@@ -123,12 +430,20 @@ def push_to_a365_with_retry(
         session_id, artifact_type, resolved_artifact_id
     )
 
-    duplicate_check = _idempotency_tracker.check_duplicate(dedupe_key, validated)
+    if in_flight is not None:
+        if dedupe_key in in_flight:
+            duplicate_check = {"duplicate": True, "message": "Duplicate item in the same batch"}
+        else:
+            in_flight.add(dedupe_key)
+            duplicate_check = _idempotency_tracker.check_duplicate(dedupe_key, validated)
+    else:
+        duplicate_check = _idempotency_tracker.check_duplicate(dedupe_key, validated)
 
     if duplicate_check and duplicate_check.get("duplicate"):
         logger.info(
-            f"[{session_id}] Duplicate detected for key={dedupe_key}. "
-            f"Already completed at {duplicate_check.get('completed_at')}. Skipping push."
+            "[%s] Duplicate detected for key=%s. Already completed at %s. Skipping push.",
+            session_id, dedupe_key, duplicate_check.get("completed_at"),
+            extra={"session_id": session_id, "dedupe_key": dedupe_key},
         )
         return {
             "status": "skipped",
@@ -139,7 +454,7 @@ def push_to_a365_with_retry(
             "dedupe_key": dedupe_key,
             "retryable": False,
             "visible_to_user": None,
-        }
+        }, None
 
     # ── Step 3: Record attempt as in_progress ─────────────────────────────────
     _idempotency_tracker.record_attempt(
@@ -151,18 +466,18 @@ def push_to_a365_with_retry(
         status="in_progress",
     )
 
-    logger.info(f"[{session_id}] Starting CRM push — contact={contact_id}, key={dedupe_key}")
-    logger.info(f"[{session_id}] Artifacts: 1 note, {len(tasks)} tasks, {len(tags)} tags")
-
-    # ── Step 4: Execute push ──────────────────────────────────────────────────
-    result = _rate_limiter.execute_with_backoff(
-        push_to_a365,
-        summary=summary,
-        tasks=tasks,
-        tags=tags,
-        contact_id=contact_id,
+    logger.info(
+        "[%s] Starting CRM push — contact=%s, key=%s, artifacts: 1 note, %d tasks, %d tags",
+        session_id, contact_id, dedupe_key, len(tasks), len(tags),
+        extra={"session_id": session_id, "contact_id": contact_id, "dedupe_key": dedupe_key},
     )
 
+    return None, (idempotency_key, dedupe_key)
+
+
+def _finish_push(result: dict, session_id: str, tasks: list, tags: list,
+                 idempotency_key: str, dedupe_key: str) -> dict:
+    """Step 5 of a guarded push: record the outcome and build the caller-facing response."""
     # ── Step 5: Record outcome ────────────────────────────────────────────────
     if result["status"] == "success":
         _idempotency_tracker.mark_completed(dedupe_key)
@@ -173,7 +488,11 @@ def push_to_a365_with_retry(
             "tag_ids": [f"tag_{uuid.uuid4().hex[:8]}" for _ in tags],
         }
 
-        logger.info(f"[{session_id}] Push successful. Artifacts: {artifact_ids}")
+        logger.info("[%s] Push successful", session_id,
+                    extra={"session_id": session_id, "dedupe_key": dedupe_key})
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[%s] Artifacts: %s", session_id, artifact_ids,
+                         extra={"session_id": session_id})
 
         return {
             "status": "success",
@@ -189,7 +508,8 @@ def push_to_a365_with_retry(
 
     elif result["status"] == "rate_limit_exceeded":
         _idempotency_tracker.mark_failed(dedupe_key)
-        logger.error(f"[{session_id}] Rate limit exceeded after {result.get('attempts')} attempts")
+        logger.error("[%s] Rate limit exceeded after %s attempts", session_id, result.get("attempts"),
+                     extra={"session_id": session_id, "dedupe_key": dedupe_key})
 
         return {
             "status": "error",
@@ -205,7 +525,8 @@ def push_to_a365_with_retry(
 
     else:
         _idempotency_tracker.mark_failed(dedupe_key)
-        logger.error(f"[{session_id}] Push failed: {result.get('last_error')}")
+        logger.error("[%s] Push failed: %s", session_id, result.get("last_error"),
+                     extra={"session_id": session_id, "dedupe_key": dedupe_key})
 
         return {
             "status": "error",
@@ -238,8 +559,14 @@ def get_rate_limit_status() -> dict:
 
 
 def _get_status_message(status: str, stats: dict) -> str:
+    # round() matches the old :.0f formatting; the overlay polls this every second or so
+    return _status_message(status, round(stats["current_backoff"]))
+
+
+@functools.lru_cache(maxsize=64)
+def _status_message(status: str, backoff_seconds: int) -> str:
     if status == "backing_off":
-        return f"Waiting {stats['current_backoff']:.0f}s due to rate limit"
+        return f"Waiting {backoff_seconds}s due to rate limit"
     elif status == "rate_limited":
         return "CRM rate limit active — requests may be delayed"
     return "CRM connection normal"
@@ -247,4 +574,5 @@ def _get_status_message(status: str, stats: dict) -> str:
 
 def reset_rate_limiter():
     """Reset rate limiter (for testing)."""
-    _rate_limiter.reset()
\ No newline at end of file
+    _rate_limiter.reset()
+    _request_window.reset()
\ No newline at end of file
@@ -1,3 +1,21 @@
+import functools
+import re
+
+
+def _compile_keyword_cascade(*tiers: dict):
+    """
+    Fold priority-ordered {keyword: tag_id} tiers into one regex + rank table.
+    The lookahead reports every (overlapping) match start, and alternatives are
+    listed in priority order, so the lowest rank seen is the cascade's answer.
+    """
+    rank = {}
+    for tier in tiers:
+        for keyword, tag_id in tier.items():
+            rank.setdefault(keyword, (len(rank), tag_id))
+    pattern = re.compile("(?=(" + "|".join(map(re.escape, rank)) + "))")
+    return pattern, rank
+
+
 class TagTaxonomy:
     
     OBJECTION_TYPES = {
@@ -40,38 +58,51 @@ class TagTaxonomy:
         "slow": "pain_slow_response"
     }
     
+    # Free-text phrases that map onto the QUALIFICATION tiers
+    QUALIFICATION_PHRASES = {
+        "hot": "qualified_hot",
+        "very interested": "qualified_hot",
+        "ready": "qualified_hot",
+        "interested": "qualified_warm",
+        "considering": "qualified_warm",
+        "evaluating": "qualified_warm",
+        "not sure": "qualified_cold",
+        "maybe": "qualified_cold",
+        "thinking": "qualified_cold"
+    }
+    
+    # Single pass over the tag instead of ~30 separate substring scans; tier order
+    # is the precedence: objections, qualification, competitors, next steps, pain
+    _KEYWORD_RE, _KEYWORD_RANK = _compile_keyword_cascade(
+        OBJECTION_TYPES, QUALIFICATION_PHRASES, COMPETITORS, NEXT_STEPS, PAIN_POINTS
+    )
+    
     @classmethod
     def normalize_tag(cls, raw_tag: str) -> str:
-        raw_lower = raw_tag.lower().strip()
-        
-        for keyword, tag_id in cls.OBJECTION_TYPES.items():
-            if keyword in raw_lower:
-                return tag_id
-        
-        if any(word in raw_lower for word in ["hot", "very interested", "ready"]):
-            return cls.QUALIFICATION["hot"]
-        elif any(word in raw_lower for word in ["interested", "considering", "evaluating"]):
-            return cls.QUALIFICATION["warm"]
-        elif any(word in raw_lower for word in ["not sure", "maybe", "thinking"]):
-            return cls.QUALIFICATION["cold"]
-        
-        for keyword, tag_id in cls.COMPETITORS.items():
-            if keyword in raw_lower:
-                return tag_id
-        
-        for keyword, tag_id in cls.NEXT_STEPS.items():
-            if keyword in raw_lower:
-                return tag_id
+        return cls._normalize_lower(raw_tag.lower().strip())
+    
+    # Raw tags repeat heavily across sessions ("price", "demo", "hubspot"), so the
+    # keyword scan below runs once per distinct tag rather than once per call
+    @classmethod
+    @functools.lru_cache(maxsize=4096)
+    def _normalize_lower(cls, raw_lower: str) -> str:
+        best = None
+        for match in cls._KEYWORD_RE.finditer(raw_lower):
+            candidate = cls._KEYWORD_RANK[match.group(1)]
+            if best is None or candidate < best:
+                best = candidate
         
-        for keyword, tag_id in cls.PAIN_POINTS.items():
-            if keyword in raw_lower:
-                return tag_id
+        if best is not None:
+            return best[1]
         
         return f"other_{raw_lower.replace(' ', '_')[:20]}"
     
     @classmethod
     def normalize_tags(cls, raw_tags: list) -> list:
-        return [cls.normalize_tag(tag) for tag in raw_tags]
+        # Session tag lists repeat the same raw values; normalise each distinct one once
+        seen = {}
+        normalize = cls.normalize_tag
+        return [seen[tag] if tag in seen else seen.setdefault(tag, normalize(tag)) for tag in raw_tags]
 
 
 class NoteFormatter:
@@ -108,35 +139,36 @@ class TaskFormatter:
     
     @staticmethod
     def ensure_atomic_tasks(tasks: list, min_tasks: int = 2, max_tasks: int = 7) -> list:
-        cleaned = []
-        
-        for task in tasks:
-            task = task.strip()
-            
-            if len(task) < 5:
-                continue
-            
-            if not any(char.isupper() or char.isdigit() for char in task):
-                task = task.capitalize()
-            
-            if not task.endswith(('.', '?', '!')):
-                task += ""
-            
-            if TaskFormatter._is_vague(task):
-                task = TaskFormatter._make_specific(task)
-            
-            cleaned.append(task)
+        polish = TaskFormatter._polish_task
+        stripped = (task.strip() for task in tasks)
+        cleaned = [polish(task) for task in stripped if len(task) >= 5]
         
         if len(cleaned) < min_tasks:
             cleaned.append("Schedule follow-up call to discuss next steps")
         
         return cleaned[:max_tasks]
     
+    _DIGIT_RE = re.compile(r"\d")
+    
+    @staticmethod
+    def _polish_task(task: str) -> str:
+        # Capitalise only tasks with no uppercase and no digits. islower() scans in C;
+        # strings with no cased characters fail it, but capitalize() is a no-op on them
+        if task.islower() and not TaskFormatter._DIGIT_RE.search(task):
+            task = task.capitalize()
+        
+        if TaskFormatter._is_vague(task):
+            task = TaskFormatter._make_specific(task)
+        
+        return task
+    
+    # Substring (not word-boundary) match, same as the old any(... in ...) scan
+    _VAGUE_RE = re.compile("follow up|check in|touch base|send stuff|call|email")
+    
     @staticmethod
     def _is_vague(task: str) -> bool:
-        vague_words = ["follow up", "check in", "touch base", "send stuff", "call", "email"]
-        task_lower = task.lower()
-        return any(vague in task_lower for vague in vague_words) and len(task) < 30
+        # Length check first — long tasks never need lowercasing or scanning
+        return len(task) < 30 and TaskFormatter._VAGUE_RE.search(task.lower()) is not None
     
     @staticmethod
     def _make_specific(task: str) -> str:
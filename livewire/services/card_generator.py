@@ -1,5 +1,6 @@
-import json
+import orjson
 import logging
+from collections.abc import Mapping
 from typing import List, Dict, Any
 
 # --- CONFIGURATION ---
@@ -9,9 +10,11 @@ logger = logging.getLogger(__name__)
 
 # Max card body length — keeps cards readable and UI-safe
 MAX_BODY_LENGTH = 300
+_ELLIPSIS = "..."
 
 GROUNDING_THRESHOLD = 1.25  # L2 distance threshold for grounding
-def generate_cards(transcript_window: str, retrieved_chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+_INV_THRESHOLD = 1.0 / GROUNDING_THRESHOLD  # multiply instead of divide per card
+def generate_cards(transcript_window: str, retrieved_chunks: List[Any]) -> List[Dict[str, Any]]:
     """
     S4-WS4-3 Grounding Enforcement — converts retrieved chunks into battle cards.
 
@@ -21,6 +24,9 @@ def generate_cards(transcript_window: str, retrieved_chunks: List[Dict[str, Any]
       - If chunks present → return 1 grounded card per chunk (max 3 for v0)
       - Every grounded card must cite its source chunk_id (traceability)
       - Ungrounded cards must be explicitly labeled grounded=False
+
+    retrieved_chunks are retrieve.Chunk tuples, or dicts with the same keys (the
+    retrieval schema in Architecture_Design.md §2.5).
     """
 
     # 1. RETRIEVAL GATE (DoD: if no relevant chunk → clarifying question, not fabricated advice)
@@ -28,44 +34,58 @@ def generate_cards(transcript_window: str, retrieved_chunks: List[Dict[str, Any]
         logger.info("No chunks passed threshold. Returning ungrounded fallback card.")
         return [_generate_fallback_card()]
 
-    generated_cards = []
-
     # 2. SOURCE-BACKED CARD GENERATION (max 3 cards for v0 — arch §2.5)
-    for i, chunk in enumerate(retrieved_chunks[:3]):
+    generated_cards = [
+        _build_grounded_card(i, chunk) for i, chunk in enumerate(retrieved_chunks[:3])
+    ]
+
+    logger.info(f"Generated {len(generated_cards)} grounded card(s).")
+    return generated_cards
+
+
+def _build_grounded_card(i: int, chunk) -> Dict[str, Any]:
+    """Build one grounded card from a retrieved chunk — body is a pass-through of chunk text."""
+    if isinstance(chunk, Mapping):
         content = chunk.get("text_content", "")
         chunk_id = chunk.get("chunk_id", "unknown")
         metadata = chunk.get("metadata", {})
         raw_score = chunk.get("score", 1.0)
+    else:
+        content = chunk.text_content
+        chunk_id = chunk.chunk_id
+        metadata = chunk.metadata
+        raw_score = chunk.score
 
-        # Deterministic card ID — prevents frontend flicker on re-render
-        card_id = f"grounded-{chunk_id[:8]}"
-
-        # Title priority: section heading > source filename > generic fallback
-        # Uses metadata fields written by ingest.py (section + source_file)
-        title = metadata.get("section") or metadata.get("source_file") or f"Insight #{i + 1}"
-
-        # Truncate body to UI-safe length without altering meaning
-        if len(content) > MAX_BODY_LENGTH:
-            content = content[:MAX_BODY_LENGTH] + "..."
-
-        # Normalize L2 distance → 0-1 confidence scale against the grounding threshold
-        # score=0.0 (exact match) → 1.0 | score=threshold → 0.0 | clamped to [0, 1]
-        # Using threshold as denominator avoids negative values when score is near threshold
-        confidence = round(max(0.0, min(1.0, 1.0 - (raw_score / GROUNDING_THRESHOLD))), 2)
-
-        card = {
-            "card_id": card_id,
-            "title": title,
-            "body": content,              # STRICT: source pass-through only, no generation
-            "type": "coaching",
-            "grounded": True,             
-            "confidence_score": confidence,
-            "source_chunk_ids": [chunk_id]  # mandatory citation for traceability
-        }
-        generated_cards.append(card)
+    # Title priority: section heading > source filename > generic fallback
+    # Uses metadata fields written by ingest.py (section + source_file)
+    title = metadata.get("section") or metadata.get("source_file") or f"Insight #{i + 1}"
 
-    logger.info(f"Generated {len(generated_cards)} grounded card(s).")
-    return generated_cards
+    content = _truncate(content)
+
+    # Normalize L2 distance → 0-1 confidence scale against the grounding threshold
+    # score=0.0 (exact match) → 1.0 | score=threshold → 0.0 | clamped to [0, 1]
+    # Using threshold as denominator avoids negative values when score is near threshold
+    confidence = round(max(0.0, min(1.0, 1.0 - raw_score * _INV_THRESHOLD)), 2)
+
+    return {
+        "card_id": f"grounded-{chunk_id[:8]}",  # deterministic — prevents frontend flicker on re-render
+        "title": title,
+        "body": content,              # STRICT: source pass-through only, no generation
+        "type": "coaching",
+        "grounded": True,
+        "confidence_score": confidence,
+        "source_chunk_ids": [chunk_id]  # mandatory citation for traceability
+    }
+
+
+def _truncate(text: str, limit: int = MAX_BODY_LENGTH) -> str:
+    """
+    Cut text to a UI-safe length without altering meaning. Text already within the
+    limit is returned as-is (no copy), so callers that pre-truncate pay nothing here.
+    """
+    if len(text) <= limit:
+        return text
+    return "".join((text[:limit], _ELLIPSIS))
 
 
 def _generate_fallback_card() -> Dict[str, Any]:
@@ -84,27 +104,36 @@ def _generate_fallback_card() -> Dict[str, Any]:
     }
 
 
+def _dumps(cards: List[Dict[str, Any]]) -> str:
+    """Pretty-print cards as JSON (orjson returns bytes; decode for stdout)."""
+    return orjson.dumps(cards, option=orjson.OPT_INDENT_2).decode()
+
+
 # --- TEST BLOCK ---
 if __name__ == "__main__":
+    from retrieve import Chunk
 
     print("--- Test 1: Retrieval Hit (Grounded Card) ---")
-    mock_chunks = [{
-        "chunk_id": "uuid-1234-abcd",
-        "text_content": "Pricing starts at $99/mo for the Standard plan.",
-        "score": 1.219,
-        "metadata": {"section": "PRICING", "source_file": "gold_playbook.pdf"}
-    }]
-    print(json.dumps(generate_cards("How much does it cost?", mock_chunks), indent=2))
+    mock_chunks = [Chunk(
+        chunk_id="uuid-1234-abcd",
+        score=1.219,
+        confidence=0.95,
+        grounded=True,
+        text_content="Pricing starts at $99/mo for the Standard plan.",
+        metadata={"section": "PRICING", "source_file": "gold_playbook.pdf"}
+    )]
+    print(_dumps(generate_cards("How much does it cost?", mock_chunks)))
 
     print("\n--- Test 2: Retrieval Miss (Fallback Card) ---")
-    print(json.dumps(generate_cards("What is the weather in Tokyo?", []), indent=2))
+    print(_dumps(generate_cards("What is the weather in Tokyo?", [])))
 
     print("\n--- Test 3: Multiple Chunks (Max 3 cards) ---")
     multi_chunks = [
-        {"chunk_id": f"uuid-000{i}", "text_content": f"Content chunk {i}.", "score": 0.3 + i * 0.1,
-         "metadata": {"section": "OBJECTIONS", "source_file": "gold_playbook.pdf"}}
+        Chunk(chunk_id=f"uuid-000{i}", score=0.3 + i * 0.1, confidence=0.95, grounded=True,
+              text_content=f"Content chunk {i}.",
+              metadata={"section": "OBJECTIONS", "source_file": "gold_playbook.pdf"})
         for i in range(5)
     ]
     cards = generate_cards("tell me about objections", multi_chunks)
     print(f"Returned {len(cards)} cards (expected 3 max)")
-    print(json.dumps(cards, indent=2))
\ No newline at end of file
+    print(_dumps(cards))
\ No newline at end of file
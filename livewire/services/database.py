@@ -1,6 +1,10 @@
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
 from datetime import datetime
+import atexit
 import logging
+import threading
+import time
 
 # Configure logging for database operations
 logger = logging.getLogger(__name__)
@@ -17,26 +21,94 @@ except Exception as e:
     logger.warning(f"MongoDB not connected: {e}. Logs will not be saved.")
     conversations = None
 
+# Write buffering: records are queued and written with one insert_many per batch
+# instead of one insert_one round trip per card payload. Queued records live only in
+# memory: a crash (not a clean exit, which flushes via atexit) loses whatever was
+# queued in the last FLUSH_INTERVAL_SECONDS, or longer while MongoDB is unreachable.
+FLUSH_BATCH_SIZE = 100        # flush as soon as this many records are queued
+FLUSH_INTERVAL_SECONDS = 2.0  # ...otherwise the background flusher writes them this often
+MAX_PENDING_RECORDS = 10 * FLUSH_BATCH_SIZE  # requeue cap while writes keep failing
+
+_pending = []
+_pending_lock = threading.Lock()
+_flusher = None
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL_SECONDS)
+        flush_conversations()
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is None:
+        with _pending_lock:
+            if _flusher is None:
+                _flusher = threading.Thread(target=_flush_loop, name="mongo-flush", daemon=True)
+                _flusher.start()
+
+def flush_conversations():
+    """
+    Writes every queued conversation record to MongoDB in one batch.
+    Called by the background flusher, on the size threshold, and at interpreter exit.
+    """
+    global _pending
+    with _pending_lock:
+        batch, _pending = _pending, []
+    if not batch:
+        return
+
+    try:
+        # ordered=False: one bad document doesn't stop the rest of the batch
+        conversations.insert_many(batch, ordered=False)
+        logger.info(f"💾 Saved {len(batch)} conversation log(s)")
+    except BulkWriteError as e:
+        # Per-document failures (e.g. duplicate _id from an earlier partial write);
+        # everything else in the batch was written, and retrying won't fix these
+        inserted = e.details.get("nInserted", 0)
+        logger.error(f"Saved {inserted}/{len(batch)} record(s); "
+                     f"{len(e.details.get('writeErrors', []))} rejected: {e}")
+    except Exception as e:
+        # Connection-level failure: nothing is known to be written, so put the batch
+        # back at the front of the queue for the next flush. insert_many already set
+        # each record's _id, so a retry can't double-write a record that did land
+        _requeue(batch)
+        logger.error(f"Failed to save {len(batch)} record(s) to DB, will retry: {e}")
+
+def _requeue(batch):
+    global _pending
+    with _pending_lock:
+        _pending = batch + _pending
+        overflow = len(_pending) - MAX_PENDING_RECORDS
+        if overflow > 0:
+            del _pending[:overflow]
+    if overflow > 0:
+        logger.error(f"Write queue full — dropped {overflow} oldest record(s)")
+
 def save_conversation(client_id, cards_payload):
     """
-    Saves the generated cards to MongoDB for analytics.
+    Queues the generated cards for MongoDB analytics storage.
     Input: cards_payload (List[Dict]) - The JSON output sent to frontend
     """
     if conversations is None:
         return
 
-    try:
-        record = {
-            "client_id": client_id,
-            "timestamp": datetime.now(),
-            "cards": cards_payload  # Stores the full JSON structure
-        }
-        conversations.insert_one(record)
-        logger.info(f"💾 Saved conversation log for {client_id}")
-    except Exception as e:
-        logger.error(f"Failed to save to DB: {e}")
+    record = {
+        "client_id": client_id,
+        "timestamp": datetime.now(),
+        "cards": cards_payload  # Stores the full JSON structure
+    }
+    with _pending_lock:
+        _pending.append(record)
+        full = len(_pending) >= FLUSH_BATCH_SIZE
+    _ensure_flusher()
+    if full:
+        flush_conversations()
 
 def get_past_conversations(client_id):
     if conversations is None:
         return []
-    return list(conversations.find({"client_id": client_id}, {"_id": 0}))
\ No newline at end of file
+    flush_conversations()  # read-your-writes: include records still queued
+    return list(conversations.find({"client_id": client_id}, {"_id": 0}))
+
+# Don't drop queued records on shutdown
+atexit.register(flush_conversations)
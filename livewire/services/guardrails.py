@@ -1,22 +1,30 @@
-from datetime import datetime, timedelta
+from datetime import datetime
 from collections import deque
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
 class GuardrailEngine:
-    def __init__(self):
+    def __init__(self, clock=time.monotonic):
+        # Monotonic seconds source for debounce and the rate window — injectable so
+        # tests can advance time virtually instead of sleeping
+        self._clock = clock
         self.last_card_time = None
+        self._last_card_monotonic = None
         self.recent_objections = deque(maxlen=10)
+        # clock() time of each shown card, oldest first — expired entries are
+        # popped off the left, so the 5-minute count is just len()
         self.objection_timestamps = deque(maxlen=10)
         self.DEBOUNCE_SECONDS = 30
         self.MAX_CARDS_PER_5MIN = 3
+        self.RATE_WINDOW_SECONDS = 300
         
     def should_show_card(self, objection_type: str) -> bool:
-        now = datetime.now()
+        now = self._clock()
         
-        if self.last_card_time:
-            time_since_last = (now - self.last_card_time).total_seconds()
+        if self._last_card_monotonic is not None:
+            time_since_last = now - self._last_card_monotonic
             if time_since_last < self.DEBOUNCE_SECONDS:
                 logger.info(f"Card blocked: debounce ({time_since_last:.1f}s < {self.DEBOUNCE_SECONDS}s)")
                 return False
@@ -25,31 +33,35 @@ class GuardrailEngine:
             logger.info(f"Card blocked: duplicate objection type '{objection_type}'")
             return False
         
-        five_min_ago = now - timedelta(minutes=5)
-        recent_count = sum(1 for ts in self.objection_timestamps if ts > five_min_ago)
+        recent_count = self._count_recent(now)
         if recent_count >= self.MAX_CARDS_PER_5MIN:
             logger.info(f"Card blocked: rate limit ({recent_count}/{self.MAX_CARDS_PER_5MIN} in 5min)")
             return False
         
-        self.last_card_time = now
+        self._last_card_monotonic = now
+        self.last_card_time = datetime.now()
         self.recent_objections.append(objection_type)
         self.objection_timestamps.append(now)
         logger.info(f"Card allowed: '{objection_type}'")
         return True
     
+    def _count_recent(self, now: float) -> int:
+        cutoff = now - self.RATE_WINDOW_SECONDS
+        timestamps = self.objection_timestamps
+        while timestamps and timestamps[0] <= cutoff:
+            timestamps.popleft()
+        return len(timestamps)
+    
     def reset(self):
         self.last_card_time = None
+        self._last_card_monotonic = None
         self.recent_objections.clear()
         self.objection_timestamps.clear()
         logger.info("Guardrails reset")
     
     def get_stats(self) -> dict:
-        now = datetime.now()
-        five_min_ago = now - timedelta(minutes=5)
-        recent_count = sum(1 for ts in self.objection_timestamps if ts > five_min_ago)
-        
         return {
-            "cards_shown_last_5min": recent_count,
+            "cards_shown_last_5min": self._count_recent(self._clock()),
             "last_card_time": self.last_card_time.isoformat() if self.last_card_time else None,
             "recent_objections": list(self.recent_objections)
         }
\ No newline at end of file
@@ -1,63 +1,117 @@
 import sqlite3
 import hashlib
 import json
+import orjson
+import threading
 from datetime import datetime, timedelta
 from typing import Optional, Dict
 
 class IdempotencyTracker:
+    # Statement text is fixed, so sqlite3's per-connection statement cache reuses the
+    # prepared statements across calls on the long-lived connection
+    _SQL_CHECK = """
+        SELECT status, completed_at, attempts, payload_hash
+        FROM crm_pushes
+        WHERE dedupe_key = ?
+    """
+    
+    # Upsert: one index probe on dedupe_key; a re-attempt resets the row like the old
+    # INSERT OR REPLACE did (completed_at cleared) but bumps attempts in place
+    _SQL_INSERT = """
+        INSERT INTO crm_pushes 
+        (dedupe_key, session_id, artifact_type, artifact_id, payload_hash, 
+         status, created_at, attempts)
+        VALUES (?, ?, ?, ?, ?, ?, ?, 1)
+        ON CONFLICT(dedupe_key) DO UPDATE SET
+            session_id = excluded.session_id,
+            artifact_type = excluded.artifact_type,
+            artifact_id = excluded.artifact_id,
+            payload_hash = excluded.payload_hash,
+            status = excluded.status,
+            created_at = excluded.created_at,
+            completed_at = NULL,
+            attempts = attempts + 1
+    """
+    
+    _SQL_COMPLETE = """
+        UPDATE crm_pushes
+        SET status = 'completed', completed_at = ?
+        WHERE dedupe_key = ?
+    """
+    
+    _SQL_FAIL = """
+        UPDATE crm_pushes
+        SET status = 'failed'
+        WHERE dedupe_key = ?
+    """
+    
+    _SQL_CLEANUP = """
+        DELETE FROM crm_pushes
+        WHERE created_at < ?
+    """
+    
     def __init__(self, db_path: str = "livewire_idempotency.db"):
         self.db_path = db_path
+        # One long-lived connection instead of a connect/close per call. Autocommit
+        # (isolation_level=None) keeps each statement its own transaction; the lock
+        # serialises use from FastAPI's thread pool and the batch push workers
+        self._conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
         self._init_db()
     
     def _init_db(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS crm_pushes (
-                dedupe_key TEXT PRIMARY KEY,
-                session_id TEXT NOT NULL,
-                artifact_type TEXT NOT NULL,
-                artifact_id TEXT NOT NULL,
-                payload_hash TEXT NOT NULL,
-                status TEXT NOT NULL,
-                created_at TEXT NOT NULL,
-                completed_at TEXT,
-                attempts INTEGER DEFAULT 1
-            )
-        """)
-        
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_session_id 
-            ON crm_pushes(session_id)
-        """)
-        
-        conn.commit()
-        conn.close()
+        with self._lock:
+            cursor = self._conn.cursor()
+            
+            # WAL: readers don't block the writer and commits skip the rollback-journal fsync
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute("PRAGMA temp_store=MEMORY")
+            
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS crm_pushes (
+                    dedupe_key TEXT PRIMARY KEY,
+                    session_id TEXT NOT NULL,
+                    artifact_type TEXT NOT NULL,
+                    artifact_id TEXT NOT NULL,
+                    payload_hash TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    completed_at TEXT,
+                    attempts INTEGER DEFAULT 1
+                )
+            """)
+            
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_session_id 
+                ON crm_pushes(session_id)
+            """)
+            
+            # cleanup_old_records range-scans this instead of sweeping the whole table
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_created_at 
+                ON crm_pushes(created_at)
+            """)
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
     
     def generate_dedupe_key(self, session_id: str, artifact_type: str, artifact_id: str) -> str:
         return f"{session_id}:{artifact_type}:{artifact_id}"
     
     def check_duplicate(self, dedupe_key: str, payload: dict) -> Optional[Dict]:
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT status, completed_at, attempts, payload_hash
-            FROM crm_pushes
-            WHERE dedupe_key = ?
-        """, (dedupe_key,))
-        
-        result = cursor.fetchone()
-        conn.close()
+        # Always consult the DB: other trackers and worker processes share it, so no
+        # in-memory view of the recorded keys can rule a key out
+        with self._lock:
+            result = self._conn.execute(self._SQL_CHECK, (dedupe_key,)).fetchone()
         
         if not result:
             return None
         
         status, completed_at, attempts, stored_hash = result
-        payload_hash = self._hash_payload(payload)
         
-        if stored_hash != payload_hash:
+        if not self._hash_matches(stored_hash, payload):
             return {
                 "duplicate": False,
                 "reason": "payload_changed",
@@ -85,64 +139,40 @@ class IdempotencyTracker:
     
     def record_attempt(self, dedupe_key: str, session_id: str, artifact_type: str, 
                        artifact_id: str, payload: dict, status: str = "in_progress"):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         payload_hash = self._hash_payload(payload)
         now = datetime.now().isoformat()
         
-        cursor.execute("""
-            INSERT OR REPLACE INTO crm_pushes 
-            (dedupe_key, session_id, artifact_type, artifact_id, payload_hash, 
-             status, created_at, attempts)
-            VALUES (?, ?, ?, ?, ?, ?, ?, 
-                    COALESCE((SELECT attempts + 1 FROM crm_pushes WHERE dedupe_key = ?), 1))
-        """, (dedupe_key, session_id, artifact_type, artifact_id, payload_hash, 
-              status, now, dedupe_key))
-        
-        conn.commit()
-        conn.close()
+        with self._lock:
+            self._conn.execute(self._SQL_INSERT, (dedupe_key, session_id, artifact_type, 
+                                                  artifact_id, payload_hash, status, now))
     
     def mark_completed(self, dedupe_key: str):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            UPDATE crm_pushes
-            SET status = 'completed', completed_at = ?
-            WHERE dedupe_key = ?
-        """, (datetime.now().isoformat(), dedupe_key))
-        
-        conn.commit()
-        conn.close()
+        with self._lock:
+            self._conn.execute(self._SQL_COMPLETE, (datetime.now().isoformat(), dedupe_key))
     
     def mark_failed(self, dedupe_key: str):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            UPDATE crm_pushes
-            SET status = 'failed'
-            WHERE dedupe_key = ?
-        """, (dedupe_key,))
-        
-        conn.commit()
-        conn.close()
+        with self._lock:
+            self._conn.execute(self._SQL_FAIL, (dedupe_key,))
     
     def _hash_payload(self, payload: dict) -> str:
+        # orjson emits canonical sorted-key bytes directly; 128-bit blake2b is ample for dedup
+        payload_bytes = orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+        return hashlib.blake2b(payload_bytes, digest_size=16).hexdigest()
+    
+    def _legacy_hash_payload(self, payload: dict) -> str:
+        # Pre-BLAKE2b rows store sha256(json.dumps(sort_keys=True)) — 64 hex chars
         payload_str = json.dumps(payload, sort_keys=True)
         return hashlib.sha256(payload_str.encode()).hexdigest()
     
+    def _hash_matches(self, stored_hash: str, payload: dict) -> bool:
+        # Rows written before the hash change keep deduping instead of reading as
+        # payload_changed (which would push completed artifacts to GHL again)
+        if len(stored_hash) == 64:
+            return stored_hash == self._legacy_hash_payload(payload)
+        return stored_hash == self._hash_payload(payload)
+    
     def cleanup_old_records(self, days: int = 30):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         cutoff = (datetime.now() - timedelta(days=days)).isoformat()
         
-        cursor.execute("""
-            DELETE FROM crm_pushes
-            WHERE created_at < ?
-        """, (cutoff,))
-        
-        conn.commit()
-        conn.close()
+        with self._lock:
+            self._conn.execute(self._SQL_CLEANUP, (cutoff,))
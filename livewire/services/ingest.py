@@ -1,68 +1,113 @@
 import os
-import json
+import orjson
 import uuid
 import re
+import threading
 import numpy as np
-import faiss
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from sentence_transformers import SentenceTransformer
+from functools import partial
 from pypdf import PdfReader
-import pytesseract
-from pdf2image import convert_from_path
+from ocr import ocr_page_text
 
 # --- CONFIGURATION ---
 # All file paths are relative to this script's location
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 PLAYBOOK_FILE = os.path.join(BASE_DIR, "..", "gold_playbook.pdf")   # input PDF
-VECTOR_STORE_FILE = os.path.join(BASE_DIR, "local_vector_db.json")  # output: chunk records
+VECTOR_STORE_FILE = os.path.join(BASE_DIR, "local_vector_db.ndjson")  # output: chunk records, one per line
 INDEX_FILE = os.path.join(BASE_DIR, "vector_index.bin")             # output: FAISS vector index
 
-# Paths to Windows OCR binaries (only used if PDF is image-based)
-pytesseract.pytesseract.tesseract_cmd = r"C:\Users\vedan\AppData\Local\Programs\Tesseract-OCR\tesseract.exe"
-POPPLER_PATH = r"C:\Users\vedan\poppler-25.12.0\Library\bin"
+# Above this many chunks the exact flat scan gives way to an HNSW graph index
+HNSW_MIN_CHUNKS = 5000
+HNSW_M = 32                   # graph neighbours per node
+HNSW_EF_CONSTRUCTION = 200    # build-time beam width (higher = better recall, slower build)
 
 # --- MODEL (lazy-loaded) ---
-# SentenceTransformer is only loaded when first needed,
-# so importing this file doesn't slow down other services (e.g. FastAPI)
+# SentenceTransformer (and torch) are only imported and loaded when first needed,
+# so importing this file doesn't slow down other services (e.g. FastAPI) — nor the
+# OCR worker processes, which re-import this script when spawned (Windows, macOS)
 _model = None
+_model_lock = threading.Lock()
 
 def get_model():
     global _model
     if _model is None:
-        print("   -> Loading embedding model...")
-        _model = SentenceTransformer('all-MiniLM-L6-v2')
+        # Double-checked: concurrent first callers load the weights once, not once each
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import SentenceTransformer
+                print("   -> Loading embedding model...")
+                if _has_accelerator():
+                    model = SentenceTransformer('all-MiniLM-L6-v2')
+                    # Half precision on accelerators — half the memory traffic, tensor-core
+                    # matmuls. CPU stays FP32 (FP16 matmul is slower there)
+                    model.half()
+                else:
+                    model = _load_onnx_model() or SentenceTransformer('all-MiniLM-L6-v2')
+                _model = model
     return _model
 
 
-# --- TEXT EXTRACTION ---
-def extract_page_text(page, page_num):
+def _has_accelerator():
+    """Same device pick SentenceTransformer makes on its own: CUDA, then Apple MPS."""
+    import torch  # already loaded by sentence_transformers
+    return torch.cuda.is_available() or torch.backends.mps.is_available()
+
+
+def _load_onnx_model():
     """
-    Extract raw text from a single PDF page.
-    - First tries pypdf (fast, works on text-based PDFs)
-    - If pypdf returns nothing, the page is image-based — falls back to Tesseract OCR
+    CPU-only: the same MiniLM weights served by ONNX Runtime — graph-optimised kernels,
+    several times faster than PyTorch eager for encode(). Kept FP32 so document vectors
+    stay comparable with retrieve.py's queries against DISTANCE_THRESHOLD (int8 would
+    shift L2 distances). Needs sentence-transformers>=3.2 with onnxruntime
+    (pip install "sentence-transformers[onnx]"); returns None to keep PyTorch otherwise.
     """
-    text = page.extract_text()
-    if text and text.strip():
-        return text
-
-    # pypdf got nothing — run OCR on this page
-    print(f"   [OCR] Page {page_num} is image-based, running Tesseract...")
+    from sentence_transformers import SentenceTransformer
     try:
-        # Convert just this page to a high-res image, then OCR it
-        images = convert_from_path(
-            PLAYBOOK_FILE, dpi=300,
-            first_page=page_num, last_page=page_num,
-            poppler_path=POPPLER_PATH
-        )
-        if images:
-            return pytesseract.image_to_string(images[0], lang='eng')
+        return SentenceTransformer('all-MiniLM-L6-v2', backend="onnx")
     except Exception as e:
-        print(f"   [OCR] ERROR on page {page_num}: {e}")
+        print(f"   -> ONNX Runtime unavailable ({e.__class__.__name__}), using PyTorch")
+        return None
+
+
+# --- TEXT EXTRACTION ---
+def extract_all_pages(reader):
+    """
+    Extract raw text for every page, in page order.
+    - First tries pypdf on each page (fast, works on text-based PDFs)
+    - Pages where pypdf returns nothing are image-based — OCR'd in parallel across
+      processes, since Tesseract takes seconds per page and pages are independent
+    """
+    page_texts = [page.extract_text() or "" for page in reader.pages]
+
+    ocr_pages = [num for num, text in enumerate(page_texts, start=1) if not text.strip()]
+    if ocr_pages:
+        workers = min(len(ocr_pages), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            ocr = partial(ocr_page_text, PLAYBOOK_FILE)
+            for page_num, text in zip(ocr_pages, pool.map(ocr, ocr_pages)):
+                page_texts[page_num - 1] = text
 
-    return ""  # nothing extracted — caller will skip this page
+    return page_texts
 
 
 # --- CHUNKING ---
+_PARA_RE = re.compile(r'\n\n+')            # paragraph / Q&A boundary
+_SENT_RE = re.compile(r'(?<=[.!?]) +')     # sentence boundary inside an overlong line
+
+_HEADER_PREFIXES = ("---", "Title:")
+
+def _drop_header_lines(page_text):
+    """
+    Yield page lines minus structural headers (e.g. "---", "Title:").
+    Filtering at line level means inline content like "price: $50---$200" is untouched.
+    Blank lines pass through — Stage 1 of chunk_page_text splits paragraphs on them.
+    """
+    for line in page_text.splitlines():
+        if not line.lstrip().startswith(_HEADER_PREFIXES):
+            yield line
+
+
 def chunk_page_text(page_text):
     """
     Split page text into chunks ready for embedding.
@@ -71,18 +116,12 @@ def chunk_page_text(page_text):
       2. If a chunk > 1000 chars, reassemble line-by-line with 100-char overlap
       3. Single lines > 1000 chars are split by sentence boundaries
     """
-    # Strip structural header lines (e.g. "---", "Title:") at line level
-    # so we don't accidentally corrupt inline content like "price: $50---$200"
-    clean_lines = [
-        line for line in page_text.splitlines()
-        if not line.strip().startswith("---") and not line.strip().startswith("Title:")
-    ]
-    page_text = "\n".join(clean_lines)
+    page_text = "\n".join(_drop_header_lines(page_text))
 
     sized_chunks = []
 
     # Stage 1: split on paragraph/Q&A boundaries (double newlines)
-    for semantic_chunk in re.split(r'\n\n+', page_text):
+    for semantic_chunk in _PARA_RE.split(page_text):
         semantic_chunk = semantic_chunk.strip()
         if not semantic_chunk:
             continue
@@ -92,42 +131,51 @@ def chunk_page_text(page_text):
             sized_chunks.append(semantic_chunk)
             continue
 
-        # Stage 2: chunk is too big — break it into lines and reassemble with overlap
-        current_chunk = ""
-        for line in re.split(r'\n', semantic_chunk):
+        # Stage 2: chunk is too big — break it into lines and reassemble with overlap.
+        # Pieces are buffered and joined once per emitted chunk instead of growing a
+        # string with +=; buf_len is the joined length (each piece plus one space)
+        buf, buf_len = [], 0
+        for line in semantic_chunk.split('\n'):
             line = line.strip()
             if not line:
                 continue
 
-            if len(current_chunk) + len(line) + 1 <= 1000:
+            if buf_len + len(line) + 1 <= 1000:
                 # Line fits — keep building the current chunk
-                current_chunk += line + " "
+                buf.append(line)
+                buf_len += len(line) + 1
             else:
                 # Current chunk is full — save it and start a new one
-                if current_chunk.strip():
-                    sized_chunks.append(current_chunk.strip())
+                finished = " ".join(buf).strip()
+                if finished:
+                    sized_chunks.append(finished)
 
                 if len(line) > 1000:
                     # Edge case: a single line is still too long — split by sentence
-                    temp_chunk = ""
-                    for sent in re.split(r'(?<=[.!?]) +', line):
-                        if len(temp_chunk) + len(sent) + 1 <= 1000:
-                            temp_chunk += sent + " "
+                    sents, sents_len = [], 0
+                    for sent in _SENT_RE.split(line):
+                        if sents_len + len(sent) + 1 <= 1000:
+                            sents.append(sent)
+                            sents_len += len(sent) + 1
                         else:
-                            if temp_chunk.strip():
-                                sized_chunks.append(temp_chunk.strip())
-                            temp_chunk = sent + " "
-                    if temp_chunk.strip():
-                        sized_chunks.append(temp_chunk.strip())
-                    current_chunk = ""
+                            flushed = " ".join(sents).strip()
+                            if flushed:
+                                sized_chunks.append(flushed)
+                            sents, sents_len = [sent], len(sent) + 1
+                    flushed = " ".join(sents).strip()
+                    if flushed:
+                        sized_chunks.append(flushed)
+                    buf, buf_len = [], 0
                 else:
                     # Start new chunk with last 100 chars of previous for context overlap (WS4-09)
-                    overlap = current_chunk.strip()[-100:] if len(current_chunk.strip()) >= 100 else current_chunk.strip()
-                    current_chunk = overlap + " " + line + " "
+                    overlap = finished[-100:]
+                    buf = [overlap, line]
+                    buf_len = len(overlap) + len(line) + 2
 
         # Save whatever is left in the current chunk after the loop
-        if current_chunk.strip():
-            sized_chunks.append(current_chunk.strip())
+        finished = " ".join(buf).strip()
+        if finished:
+            sized_chunks.append(finished)
 
     return sized_chunks
 
@@ -139,16 +187,41 @@ def detect_section(page_text):
     Headings are detected as: short, ALL-CAPS lines with no trailing period.
     This is used later by WS4-14 reranking to boost results from matching sections.
     """
-    section = None
-    for line in page_text.splitlines():
+    # Walk bottom-up: the first heading hit is the last one on the page, so stop there.
+    # Cheap length/punctuation checks run before the isupper() character scan
+    for line in reversed(page_text.splitlines()):
         stripped = line.strip()
-        if stripped and stripped.isupper() and len(stripped) < 80 and not stripped.endswith('.'):
-            section = stripped
-    return section
+        if stripped and len(stripped) < 80 and not stripped.endswith('.') and stripped.isupper():
+            return stripped
+    return None
+
+
+# --- INDEX ---
+def build_index(embeddings):
+    """
+    Pick the FAISS index for the playbook size.
+    - Small playbooks: IndexFlatL2 — exact L2 search, already sub-millisecond at v0 scale
+    - Large playbooks: IndexHNSWSQ — graph search, ~log N per query instead of a full
+      scan, over 8-bit scalar-quantized vectors (4x less RAM and memory bandwidth than
+      FP32). SQ8 keeps per-dimension ranges, so L2 distances move by ~1e-3 and stay
+      comparable against the retrieval DISTANCE_THRESHOLD (product quantization would not)
+    """
+    import faiss
+    dim = embeddings.shape[1]
+    if len(embeddings) < HNSW_MIN_CHUNKS:
+        index = faiss.IndexFlatL2(dim)
+    else:
+        index = faiss.IndexHNSWSQ(dim, faiss.ScalarQuantizer.QT_8bit, HNSW_M)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.train(embeddings)  # learns the per-dimension min/max for the 8-bit codes
+    index.add(embeddings)
+    return index
 
 
 # --- MAIN INGESTION ---
 def ingest_playbook():
+    import faiss  # deferred with the model imports (see MODEL note above)
+
     if not os.path.exists(PLAYBOOK_FILE):
         print(f"ERROR: File not found at {PLAYBOOK_FILE}")
         return
@@ -156,14 +229,14 @@ def ingest_playbook():
     print(f"--- INGESTING: {os.path.basename(PLAYBOOK_FILE)} ---")
 
     database_records = []  # list of chunk dicts to save as JSON
-    text_list = []         # plain text list for embedding model
+
+    ingested_at = datetime.now()  # one timestamp for the whole run; orjson writes it as ISO-8601
 
     reader = PdfReader(PLAYBOOK_FILE)
     print(f"   -> {len(reader.pages)} page(s) found")
 
     # Process each page independently to preserve page-level metadata
-    for page_num, page in enumerate(reader.pages, start=1):
-        page_text = extract_page_text(page, page_num)
+    for page_num, page_text in enumerate(extract_all_pages(reader), start=1):
 
         if not page_text.strip():
             print(f"   [WARN] Page {page_num}: no text extracted, skipping.")
@@ -179,16 +252,15 @@ def ingest_playbook():
 
             # Build the record — this is what gets saved to JSON and searched at runtime
             database_records.append({
-                "chunk_id": str(uuid.uuid4()),      # unique ID for traceability (WS4-03)
+                "chunk_id": uuid.uuid4().hex,       # unique ID for traceability (WS4-03)
                 "text_content": clean_chunk,
                 "metadata": {
                     "source_file": os.path.basename(PLAYBOOK_FILE),
                     "page": page_num,               # integer page number
                     "section": section,             # last heading seen on this page
-                    "ingested_at": str(datetime.now())
+                    "ingested_at": ingested_at
                 }
             })
-            text_list.append(clean_chunk)
 
     if not database_records:
         print("No valid chunks found.")
@@ -197,15 +269,24 @@ def ingest_playbook():
     # Generate embeddings and build FAISS index for vector search
     print(f"   -> {len(database_records)} chunks generated")
     print("   -> Generating embeddings...")
-    embeddings = get_model().encode(text_list)
-
-    # IndexFlatL2 = exact L2 distance search (no approximation) — correct for v0 scale
-    index = faiss.IndexFlatL2(embeddings.shape[1])
-    index.add(np.array(embeddings).astype('float32'))
-
-    # Save chunk records (JSON) and vector index (binary) to disk
-    with open(VECTOR_STORE_FILE, 'w', encoding='utf-8') as f:
-        json.dump(database_records, f, indent=2)
+    text_list = [record["text_content"] for record in database_records]
+    embeddings = get_model().encode(
+        text_list,
+        batch_size=128,             # MiniLM is small — bigger batches keep the matmuls saturated
+        convert_to_numpy=True,
+        show_progress_bar=False
+    )
+
+    # FAISS needs C-contiguous float32; encode() already returns that on CPU, so this
+    # is a no-op there and only copies for FP16 (GPU) output
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    index = build_index(embeddings)
+
+    # Save chunk records (NDJSON, line i = FAISS id i) and vector index (binary) to disk.
+    # One compact record per line lets the reader parse record-by-record instead of
+    # holding one giant JSON document
+    with open(VECTOR_STORE_FILE, 'wb') as f:
+        f.writelines(orjson.dumps(record) + b"\n" for record in database_records)
     faiss.write_index(index, INDEX_FILE)
 
     # Evidence pack summary log (required by S5-WS4-1 DoD)
@@ -0,0 +1,34 @@
+"""
+OCR for image-based playbook pages, kept apart from ingest.py so the worker
+processes that run it (spawned fresh on Windows and macOS) import only
+Tesseract and Poppler, not the embedding and FAISS stack.
+"""
+
+import pytesseract
+from pdf2image import convert_from_path
+
+# Paths to Windows OCR binaries (only used if PDF is image-based)
+pytesseract.pytesseract.tesseract_cmd = r"C:\Users\vedan\AppData\Local\Programs\Tesseract-OCR\tesseract.exe"
+POPPLER_PATH = r"C:\Users\vedan\poppler-25.12.0\Library\bin"
+
+
+def ocr_page_text(pdf_path, page_num):
+    """
+    OCR a single image-based PDF page with Tesseract (used when pypdf finds no text).
+    Runs in a worker process — takes only the PDF path and page number so it
+    pickles cleanly.
+    """
+    print(f"   [OCR] Page {page_num} is image-based, running Tesseract...")
+    try:
+        # Convert just this page to a high-res image, then OCR it
+        images = convert_from_path(
+            pdf_path, dpi=300,
+            first_page=page_num, last_page=page_num,
+            poppler_path=POPPLER_PATH
+        )
+        if images:
+            return pytesseract.image_to_string(images[0], lang='eng')
+    except Exception as e:
+        print(f"   [OCR] ERROR on page {page_num}: {e}")
+
+    return ""  # nothing extracted — caller will skip this page
@@ -6,7 +6,7 @@ Owner: Nishitha
 
 import re
 import hashlib
-import json
+import orjson
 from typing import Optional
 
 
@@ -185,23 +185,24 @@ def generate_idempotency_key(session_id: str, artifact_type: str, payload: dict)
     """
     Build the idempotency key per the P1-WS5.3 spec:
 
-        key = session_id + artifact_type + sha256(payload)
+        key = session_id + artifact_type + blake2b(payload)
 
     The payload hash covers the *content* so that a changed payload
     is treated as a new push (not a duplicate).
     """
     payload_hash = _hash_payload(payload)
     raw_key = f"{session_id}:{artifact_type}:{payload_hash}"
-    # Return a compact fixed-length key for the DB
-    return hashlib.sha256(raw_key.encode()).hexdigest()
+    # Return a compact fixed-length key for the DB (256-bit BLAKE2b — same 64 hex chars
+    # as the SHA-256 it replaces, faster on short inputs)
+    return hashlib.blake2b(raw_key.encode(), digest_size=32).hexdigest()
 
 
 def _hash_payload(payload: dict) -> str:
-    """Stable SHA-256 hash of a dict payload."""
+    """Stable 128-bit BLAKE2b hash of a dict payload."""
     # Exclude fields that change on every call (timestamp) so hash is stable
     hashable = {k: v for k, v in payload.items() if k not in ("timestamp", "schema_version")}
-    payload_str = json.dumps(hashable, sort_keys=True)
-    return hashlib.sha256(payload_str.encode()).hexdigest()
+    payload_bytes = orjson.dumps(hashable, option=orjson.OPT_SORT_KEYS)
+    return hashlib.blake2b(payload_bytes, digest_size=16).hexdigest()
 
 
 # ── Human-readable field reference ───────────────────────────────────────────
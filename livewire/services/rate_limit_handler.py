@@ -3,14 +3,28 @@ WS5-2.4: Rate Limit Handler for GHL/A365
 Handles API rate limits with exponential backoff
 """
 
+import asyncio
+import inspect
+import random
 import time
 import logging
-from typing import Dict, Optional, Callable
-from datetime import datetime, timedelta
+import threading
+from typing import Awaitable, Dict, NamedTuple, Optional, Callable
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from collections import deque
 
 logger = logging.getLogger(__name__)
 
+RECENT_HITS_WINDOW_SECONDS = 5 * 60  # get_stats "recent_hits_5min" window
+
+
+class RateLimitHit(NamedTuple):
+    """One rate-limit response (timestamp from the handler's monotonic clock)."""
+    timestamp: float
+    attempt: int
+    delay: float
+
 
 class RateLimitHandler:
     """
@@ -18,10 +32,41 @@ class RateLimitHandler:
     Prevents task storms and surfaces errors appropriately
     """
     
-    def __init__(self, max_retries: int = 5, base_delay: float = 1.0):
+    JITTER_MODES = ("none", "full", "equal")
+    
+    # Rate limits need the window to drain, so they back off long; transient errors
+    # (5xx, timeouts) usually clear quickly, so they retry on a shorter, lower-capped schedule
+    RATE_LIMIT_MAX_DELAY = 60.0
+    ERROR_MAX_DELAY = 5.0
+    # A server-supplied Retry-After is honoured even past the backoff cap (retrying
+    # early only earns another 429); this ceiling only guards against absurd values
+    RETRY_AFTER_MAX_DELAY = 3600.0
+    
+    def __init__(self, max_retries: int = 5, base_delay: float = 1.0,
+                 jitter: str = "full", rng: Optional[random.Random] = None,
+                 error_base_delay: float = 0.2,
+                 sleep: Callable[[float], None] = time.sleep,
+                 clock: Callable[[], float] = time.monotonic,
+                 async_sleep: Callable[[float], Awaitable[None]] = asyncio.sleep):
+        if jitter not in self.JITTER_MODES:
+            raise ValueError(f"jitter must be one of {self.JITTER_MODES}, got {jitter!r}")
         self.max_retries = max_retries
-        self.base_delay = base_delay
+        self.base_delay = base_delay              # rate-limit schedule
+        self.error_base_delay = error_base_delay  # transient-error schedule
+        self.jitter = jitter
+        # Injectable so tests can pass a seeded random.Random for reproducible delays
+        self._rng = rng or random.SystemRandom()
+        # Blocking sleep (sync retries), async sleep (async retries) and monotonic clock
+        # (hit stats) — injectable so tests can run backoff on virtual time instead of
+        # waiting it out
+        self._sleep = sleep
+        self._async_sleep = async_sleep
+        self._clock = clock
         self.rate_limit_hits = deque(maxlen=100)
+        # Clock times of hits still inside RECENT_HITS_WINDOW_SECONDS, oldest first.
+        # Same maxlen as rate_limit_hits, so it is always the in-window tail of that deque;
+        # expired entries are popped off the left, so the recent count is just len()
+        self._recent_hit_times = deque(maxlen=100)
         self.current_backoff = 0
         self.last_rate_limit_time = None
         
@@ -41,71 +86,115 @@ class RateLimitHandler:
         while attempt < self.max_retries:
             try:
                 result = func(*args, **kwargs)
-                
-                if self._is_rate_limited(result):
-                    attempt += 1
-                    delay = self._calculate_backoff(attempt)
-                    
-                    self._log_rate_limit(attempt, delay)
-                    self.rate_limit_hits.append({
-                        "timestamp": datetime.now(),
-                        "attempt": attempt,
-                        "delay": delay
-                    })
-                    
-                    if attempt < self.max_retries:
-                        logger.warning(f"Rate limited. Waiting {delay}s before retry {attempt + 1}/{self.max_retries}")
-                        time.sleep(delay)
-                        continue
-                    else:
-                        return {
-                            "status": "rate_limit_exceeded",
-                            "message": f"Rate limit hit after {self.max_retries} attempts",
-                            "attempts": attempt,
-                            "last_error": str(last_error)
-                        }
-                
-                if self._is_error(result):
-                    last_error = result.get("error", "Unknown error")
-                    attempt += 1
-                    
-                    if attempt < self.max_retries:
-                        delay = self._calculate_backoff(attempt)
-                        logger.warning(f"API error: {last_error}. Retrying in {delay}s")
-                        time.sleep(delay)
-                        continue
-                    else:
-                        return {
-                            "status": "error",
-                            "message": f"Failed after {self.max_retries} attempts",
-                            "attempts": attempt,
-                            "last_error": str(last_error)
-                        }
-                
-                logger.info(f"Request successful on attempt {attempt + 1}")
-                return {
-                    "status": "success",
-                    "data": result,
-                    "attempts": attempt + 1
-                }
-                
+                attempt, last_error, delay, final = self._after_result(attempt, last_error, result)
             except Exception as e:
-                last_error = e
-                attempt += 1
-                
-                if attempt < self.max_retries:
-                    delay = self._calculate_backoff(attempt)
-                    logger.error(f"Exception on attempt {attempt}: {e}. Retrying in {delay}s")
-                    time.sleep(delay)
+                attempt, last_error, delay, final = self._after_exception(attempt, e)
+            
+            if final is not None:
+                return final
+            self._sleep(delay)
+        
+        return self._max_retries_reached(attempt, last_error)
+    
+    async def execute_with_backoff_async(self, 
+                                         func: Callable, 
+                                         *args, 
+                                         **kwargs) -> Dict:
+        """
+        Async twin of execute_with_backoff — waits with the async sleep (asyncio.sleep
+        by default) so a backoff window never blocks the event loop (or pins a worker
+        thread) while other sessions' pushes are in flight
+        
+        func may be a coroutine function (awaited directly) or a plain blocking
+        callable (run in a worker thread via asyncio.to_thread, so the call
+        itself doesn't stall the loop either)
+        
+        Returns:
+            Result dict with status, data, and retry info
+        """
+        attempt = 0
+        last_error = None
+        
+        while attempt < self.max_retries:
+            try:
+                if inspect.iscoroutinefunction(func):
+                    result = await func(*args, **kwargs)
                 else:
-                    logger.error(f"All retries exhausted after exception: {e}")
-                    return {
-                        "status": "error",
-                        "message": f"Exception after {self.max_retries} attempts: {str(e)}",
-                        "attempts": attempt,
-                        "last_error": str(e)
-                    }
+                    result = await asyncio.to_thread(func, *args, **kwargs)
+                    if inspect.isawaitable(result):
+                        result = await result
+                attempt, last_error, delay, final = self._after_result(attempt, last_error, result)
+            except Exception as e:
+                attempt, last_error, delay, final = self._after_exception(attempt, e)
+            
+            if final is not None:
+                return final
+            await self._async_sleep(delay)
+        
+        return self._max_retries_reached(attempt, last_error)
+    
+    # Per-attempt steps shared by the sync and async loops, which differ only in how
+    # they call func and wait. Each returns (attempt, last_error, delay, final):
+    # final is the response to return, otherwise wait delay seconds and retry.
+    
+    def _after_result(self, attempt: int, last_error, result):
+        verdict = self._classify(result)
+        
+        if verdict == "rate_limit":
+            attempt += 1
+            delay = self._rate_limit_delay(result, attempt)
+            
+            self._log_rate_limit(attempt, delay)
+            self._record_hit(attempt, delay)
+            
+            if attempt < self.max_retries:
+                logger.warning(f"Rate limited. Waiting {delay:.2f}s before retry {attempt + 1}/{self.max_retries}")
+                return attempt, last_error, delay, None
+            return attempt, last_error, None, {
+                "status": "rate_limit_exceeded",
+                "message": f"Rate limit hit after {self.max_retries} attempts",
+                "attempts": attempt,
+                "last_error": str(last_error)
+            }
+        
+        if verdict == "error":
+            last_error = result.get("error", "Unknown error")
+            attempt += 1
+            
+            if attempt < self.max_retries:
+                delay = self._calculate_backoff(attempt, "error")
+                logger.warning(f"API error: {last_error}. Retrying in {delay:.2f}s")
+                return attempt, last_error, delay, None
+            return attempt, last_error, None, {
+                "status": "error",
+                "message": f"Failed after {self.max_retries} attempts",
+                "attempts": attempt,
+                "last_error": str(last_error)
+            }
+        
+        logger.info(f"Request successful on attempt {attempt + 1}")
+        return attempt, last_error, None, {
+            "status": "success",
+            "data": result,
+            "attempts": attempt + 1
+        }
+    
+    def _after_exception(self, attempt: int, e: Exception):
+        attempt += 1
         
+        if attempt < self.max_retries:
+            delay = self._calculate_backoff(attempt, "error")
+            logger.error(f"Exception on attempt {attempt}: {e}. Retrying in {delay:.2f}s")
+            return attempt, e, delay, None
+        logger.error(f"All retries exhausted after exception: {e}")
+        return attempt, e, None, {
+            "status": "error",
+            "message": f"Exception after {self.max_retries} attempts: {str(e)}",
+            "attempts": attempt,
+            "last_error": str(e)
+        }
+    
+    def _max_retries_reached(self, attempt: int, last_error) -> Dict:
         return {
             "status": "error",
             "message": "Max retries reached",
@@ -113,31 +202,64 @@ class RateLimitHandler:
             "last_error": str(last_error)
         }
     
-    def _calculate_backoff(self, attempt: int) -> float:
-        """Calculate exponential backoff delay"""
-        delay = self.base_delay * (2 ** (attempt - 1))
-        max_delay = 60.0
-        return min(delay, max_delay)
+    def _calculate_backoff(self, attempt: int, kind: str = "rate_limit") -> float:
+        """
+        Calculate exponential backoff delay for kind "rate_limit" (base_delay, capped
+        at 60s) or "error" (error_base_delay, capped at 5s), then jittered:
+          - "none":  the capped delay itself
+          - "full":  uniform in [0, capped] — callers that were rate limited together
+                     spread out instead of retrying in lockstep (thundering herd)
+          - "equal": capped/2 plus uniform in [0, capped/2] — keeps a guaranteed floor
+        """
+        if kind == "error":
+            base, max_delay = self.error_base_delay, self.ERROR_MAX_DELAY
+        else:
+            base, max_delay = self.base_delay, self.RATE_LIMIT_MAX_DELAY
+        capped = min(base * (2 ** (attempt - 1)), max_delay)
+        if self.jitter == "full":
+            return self._rng.uniform(0, capped)
+        if self.jitter == "equal":
+            half = capped / 2
+            return half + self._rng.uniform(0, half)
+        return capped
     
-    def _is_rate_limited(self, result: Dict) -> bool:
-        """Check if response indicates rate limiting"""
-        if isinstance(result, dict):
-            if result.get("status_code") == 429:
-                return True
-            if result.get("error_type") == "rate_limit":
-                return True
-            if "rate limit" in str(result.get("error", "")).lower():
-                return True
-        return False
-    
-    def _is_error(self, result: Dict) -> bool:
-        """Check if response is an error (but not rate limit)"""
+    def _rate_limit_delay(self, result: Dict, attempt: int) -> float:
+        """
+        Wait the server asked for (Retry-After) when given, else exponential backoff.
+        Read from result["retry_after"] or a raw result["headers"]["Retry-After"] and
+        not held to the 60s backoff cap (only RETRY_AFTER_MAX_DELAY); unless jitter is
+        "none", up to 10% (max 1s) is added after capping so callers told the same
+        window don't all return on the same tick.
+        """
+        retry_after = None
         if isinstance(result, dict):
-            if result.get("status") == "error":
-                return True
-            if result.get("error") and not self._is_rate_limited(result):
-                return True
-        return False
+            retry_after = result.get("retry_after")
+            if retry_after is None:
+                retry_after = parse_retry_after((result.get("headers") or {}).get("Retry-After"))
+        if retry_after is None:
+            return self._calculate_backoff(attempt, "rate_limit")
+        
+        # Cap first, then jitter, so clients told the same long wait still spread out
+        delay = min(max(float(retry_after), 0.0), self.RETRY_AFTER_MAX_DELAY)
+        if self.jitter != "none":
+            delay += self._rng.uniform(0, min(delay * 0.1, 1.0))
+        return delay
+    
+    def _classify(self, result) -> str:
+        """
+        One pass over a call result: "rate_limit" (429, error_type, or a "rate limit"
+        message), "error" (status == "error" or any other error field), else "ok"
+        """
+        if not isinstance(result, dict):
+            return "ok"
+        error = result.get("error")
+        if (result.get("status_code") == 429
+                or result.get("error_type") == "rate_limit"
+                or (error and "rate limit" in str(error).lower())):
+            return "rate_limit"
+        if result.get("status") == "error" or error:
+            return "error"
+        return "ok"
     
     def _log_rate_limit(self, attempt: int, delay: float):
         """Log rate limit hit"""
@@ -149,16 +271,24 @@ class RateLimitHandler:
             f"Backing off for {delay:.1f}s"
         )
     
+    def _record_hit(self, attempt: int, delay: float):
+        now = self._clock()
+        self.rate_limit_hits.append(RateLimitHit(now, attempt, delay))
+        self._recent_hit_times.append(now)
+        self._count_recent(now)
+    
+    def _count_recent(self, now: float) -> int:
+        cutoff = now - RECENT_HITS_WINDOW_SECONDS
+        timestamps = self._recent_hit_times
+        while timestamps and timestamps[0] <= cutoff:
+            timestamps.popleft()
+        return len(timestamps)
+    
     def get_stats(self) -> Dict:
         """Get rate limiting statistics"""
-        recent_hits = [
-            hit for hit in self.rate_limit_hits 
-            if hit["timestamp"] > datetime.now() - timedelta(minutes=5)
-        ]
-        
         return {
             "total_rate_limit_hits": len(self.rate_limit_hits),
-            "recent_hits_5min": len(recent_hits),
+            "recent_hits_5min": self._count_recent(self._clock()),
             "current_backoff": self.current_backoff,
             "last_rate_limit": self.last_rate_limit_time.isoformat() if self.last_rate_limit_time else None,
             "is_backing_off": self.current_backoff > 0
@@ -167,20 +297,88 @@ class RateLimitHandler:
     def reset(self):
         """Reset rate limit tracking"""
         self.rate_limit_hits.clear()
+        self._recent_hit_times.clear()
         self.current_backoff = 0
         self.last_rate_limit_time = None
         logger.info("Rate limit handler reset")
 
 
-def mock_ghl_api_call(payload: Dict, fail_mode: str = None) -> Dict:
-    """Mock GHL API call for testing rate limiting"""
+class SlidingWindowLimiter:
+    """
+    Proactive client-side limiter for GHL/A365 calls
+    Sliding-window log: keeps the timestamps of recent calls and allows at most
+    max_requests in any rolling period (seconds), sleeping before a call that would
+    exceed it. The full quota may be spent as one burst (there is no refill rate);
+    bursts are paced under the quota instead of discovering it through a 429 round trip
+    """
+    
+    def __init__(self, max_requests: int, period: float,
+                 sleep: Callable[[float], None] = time.sleep,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_requests = max_requests
+        self.period = period
+        # Injectable so tests can pace on virtual time instead of really sleeping
+        self._sleep = sleep
+        self._clock = clock
+        self._timestamps = deque()
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        """Block until a request slot is free, then claim it"""
+        while True:
+            with self._lock:
+                now = self._clock()
+                while self._timestamps and now - self._timestamps[0] >= self.period:
+                    self._timestamps.popleft()
+                
+                if len(self._timestamps) < self.max_requests:
+                    self._timestamps.append(now)
+                    return
+                
+                wait = self.period - (now - self._timestamps[0])
+            
+            logger.debug(f"Request window full. Pacing request for {wait:.2f}s")
+            self._sleep(wait)
+    
+    def reset(self):
+        """Forget all recorded requests"""
+        with self._lock:
+            self._timestamps.clear()
+
+
+def parse_retry_after(value) -> Optional[float]:
+    """
+    Seconds to wait from a Retry-After header value — either delta-seconds ("120")
+    or an HTTP-date ("Wed, 21 Oct 2015 07:28:00 GMT"). None if absent or unparsable.
+    """
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        retry_at = parsedate_to_datetime(str(value))
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def mock_ghl_api_call(payload: Dict, fail_mode: str = None,
+                      retry_after: Optional[float] = None) -> Dict:
+    """Mock GHL API call for testing rate limiting (retry_after: emit a Retry-After on 429)"""
     
     if fail_mode == "rate_limit":
-        return {
+        result = {
             "status_code": 429,
             "error": "Rate limit exceeded",
             "error_type": "rate_limit"
         }
+        if retry_after is not None:
+            result["headers"] = {"Retry-After": str(retry_after)}
+        return result
     
     if fail_mode == "error":
         return {
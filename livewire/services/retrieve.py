@@ -1,11 +1,13 @@
-import json
+import orjson
 import os
 import numpy as np
 import faiss
 from sentence_transformers import SentenceTransformer
 import logging
+import threading
 import time
-import functools
+from collections import OrderedDict
+from typing import NamedTuple
 
 # Silence HuggingFace HTTP noise — model is already cached locally
 os.environ["TRANSFORMERS_OFFLINE"] = "1"
@@ -13,13 +15,22 @@ os.environ["HF_HUB_OFFLINE"] = "1"
 
 # --- CONFIGURATION ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-VECTOR_STORE_FILE = os.path.join(BASE_DIR, "local_vector_db.json")
+VECTOR_STORE_FILE = os.path.join(BASE_DIR, "local_vector_db.ndjson")  # written by ingest.py
 INDEX_FILE = os.path.join(BASE_DIR, "vector_index.bin")
 
 # Grounding threshold (WS4-2.2): L2 distance — lower = more similar, 0 = exact match
 # Chunks scoring >= 1.25 are considered unrelated and filtered out
 DISTANCE_THRESHOLD = 1.25
 
+# Query-time beam width when the index is HNSW (higher = better recall, slower search)
+HNSW_EF_SEARCH = 64
+
+# Retrieval cache: keyed on the normalized query. The TTL and size cap only bound
+# memory and entry age — they don't pick up a re-ingest, because get_resources loads
+# the index and chunk database once per process (restart the service after ingesting)
+CACHE_TTL_SECONDS = 300
+CACHE_MAX_ENTRIES = 256
+
 # Logger writes to stderr so it never pollutes stdout JSON (required for WS3 integration)
 logging.basicConfig(
     level=logging.INFO,  # switch to DEBUG when tuning threshold
@@ -27,27 +38,79 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+class Chunk(NamedTuple):
+    """
+    One retrieved playbook chunk. Immutable, so cached results can be shared
+    across callers safely; use ._asdict() where a JSON object is needed.
+    """
+    chunk_id: str
+    score: float          # real L2 distance from FAISS
+    confidence: float
+    grounded: bool
+    text_content: str
+    metadata: dict
+
+
+class ChunkStore(NamedTuple):
+    """
+    Chunk database in column form (struct-of-arrays): position i in every column is
+    FAISS id i. A hit reads three list slots instead of walking a per-record dict.
+    """
+    chunk_ids: list
+    texts: list
+    metadata: list
+
+    @classmethod
+    def from_records(cls, records: list) -> "ChunkStore":
+        return cls(
+            chunk_ids=[r["chunk_id"] for r in records],
+            texts=[r["text_content"] for r in records],
+            metadata=[r.get("metadata", {}) for r in records],
+        )
+
+
 # --- GLOBAL RESOURCES (lazy-loaded once, reused across all calls) ---
 _model = None
 _index = None
 _db = None
+_resources_lock = threading.Lock()
 
 def get_resources():
     """Load the embedding model, FAISS index, and chunk database — once per session."""
     global _model, _index, _db
 
-    if _model is None:
-        logger.info("Loading sentence transformer model")
-        _model = SentenceTransformer("all-MiniLM-L6-v2")
-
-    if _index is None and os.path.exists(INDEX_FILE):
-        logger.info("Loading FAISS index")
-        _index = faiss.read_index(INDEX_FILE)
-
-    if _db is None and os.path.exists(VECTOR_STORE_FILE):
-        logger.info("Loading vector database")
-        with open(VECTOR_STORE_FILE, "r", encoding="utf-8") as f:
-            _db = json.load(f)
+    # Fast path once everything is loaded; otherwise serialise loading so concurrent
+    # first requests don't each pull the model weights into memory
+    if _model is not None and _index is not None and _db is not None:
+        return _model, _index, _db
+
+    with _resources_lock:
+        if _model is None:
+            logger.info("Loading sentence transformer model")
+            # Optional cap on torch intra-op threads, so encode() doesn't oversubscribe
+            # cores shared with FastAPI workers / FAISS
+            torch_threads = os.environ.get("LIVEWIRE_TORCH_THREADS")
+            if torch_threads:
+                import torch  # already loaded by sentence_transformers
+                torch.set_num_threads(max(1, int(torch_threads)))
+            _model = SentenceTransformer("all-MiniLM-L6-v2")
+
+        if _index is None and os.path.exists(INDEX_FILE):
+            logger.info("Loading FAISS index")
+            index = faiss.read_index(INDEX_FILE)
+            # HNSW indexes (large playbooks, see ingest.build_index): query-time beam width
+            if hasattr(index, "hnsw"):
+                index.hnsw.efSearch = HNSW_EF_SEARCH
+            _index = index
+            invalidate_cache()
+
+        if _db is None and os.path.exists(VECTOR_STORE_FILE):
+            logger.info("Loading vector database")
+            # NDJSON: one chunk record per line, in FAISS id order
+            with open(VECTOR_STORE_FILE, "rb") as f:
+                records = [orjson.loads(line) for line in f if line.strip()]
+            _db = ChunkStore.from_records(records)
+            invalidate_cache()
 
     return _model, _index, _db
 
@@ -56,9 +119,8 @@ def get_resources():
 def _run_retrieval(query: str, top_k: int) -> list:
     """
     Runs vector search and applies grounding threshold filter.
-    Separated from the cached wrapper so lru_cache works correctly
-    (lru_cache requires the decorated function to return a hashable/immutable value —
-    keeping the return as a list of dicts is fine here since we don't mutate it).
+    Separated from the cached wrapper so the cache stays a thin layer on top
+    (the Chunk tuples returned here are immutable, so cached results are safe to share).
     """
     model, index, db = get_resources()
 
@@ -68,40 +130,21 @@ def _run_retrieval(query: str, top_k: int) -> list:
 
     start_time = time.perf_counter()
 
-    # 1. Encode query into a vector and search FAISS for top-k nearest chunks
-    query_vector = model.encode([query])
-    D, I = index.search(np.array(query_vector).astype("float32"), top_k)
+    # 1. Encode query into a vector and search FAISS for top-k nearest chunks.
+    # encode() already returns a float32 ndarray, so ascontiguousarray is a no-op
+    # (no per-query copy); it only converts if the model ever returns another dtype
+    query_vector = model.encode([query], convert_to_numpy=True, show_progress_bar=False)
+    D, I = index.search(np.ascontiguousarray(query_vector, dtype=np.float32), top_k)
 
     if D.size == 0 or len(D[0]) == 0:
         return []
 
-    results = []
-    for i, idx in enumerate(I[0]):
-        if idx == -1:
-            continue  # FAISS returns -1 for empty slots when index has fewer than top_k items
-
-        raw_score = float(D[0][i])
-
-        # 2. Grounding threshold check (WS4-2.2): discard chunks that are too far away
-        if raw_score >= DISTANCE_THRESHOLD:
-            continue
-
-        record = db[idx]
-
-        # confidence + grounded are stubs until WS4-14 reranking is implemented
-        results.append({
-            "chunk_id": record["chunk_id"],
-            "score": raw_score,       # real L2 distance from FAISS
-            "confidence": 0.95,       # STUB: hardcoded until reranking built
-            "grounded": True,         # STUB: assumed true if it passed threshold
-            "text_content": record["text_content"],
-            "metadata": record.get("metadata", {})
-        })
+    results = _to_chunks(D[0], I[0], db)
 
     latency_ms = (time.perf_counter() - start_time) * 1000
 
     # NOTE: this only fires on cold start — cache hits bypass this function entirely
-    logged_data = [{"id": r["chunk_id"][:8], "score": round(r["score"], 3)} for r in results]
+    logged_data = [{"id": r.chunk_id[:8], "score": round(r.score, 3)} for r in results]
     logger.info(
         f"Retrieved {len(results)} chunks | "
         f"Latency: {latency_ms:.2f}ms | "
@@ -111,27 +154,122 @@ def _run_retrieval(query: str, top_k: int) -> list:
     return results
 
 
-# NOTE: all args must stay hashable (str, int) for lru_cache to work
-# If you add workspace_id dicts or filter objects later, switch to a manual dict cache
-@functools.lru_cache(maxsize=100)
+def _to_chunks(distances, ids, db) -> list:
+    """Turn one query's FAISS result row into grounded Chunk tuples (threshold applied)."""
+    # 2. Vectorised filter: FAISS returns -1 for empty slots when the index has fewer
+    # than top_k items, and the grounding threshold check (WS4-2.2) discards chunks that
+    # are too far away. tolist() converts the survivors to Python ints/floats in one go
+    keep = (ids != -1) & (distances < DISTANCE_THRESHOLD)
+
+    results = []
+    for idx, raw_score in zip(ids[keep].tolist(), distances[keep].tolist()):
+        # confidence + grounded are stubs until WS4-14 reranking is implemented
+        results.append(Chunk(
+            chunk_id=db.chunk_ids[idx],
+            score=raw_score,          # real L2 distance from FAISS
+            confidence=0.95,          # STUB: hardcoded until reranking built
+            grounded=True,            # STUB: assumed true if it passed threshold
+            text_content=db.texts[idx],
+            metadata=db.metadata[idx]
+        ))
+
+    return results
+
+
+_cache: "OrderedDict[tuple, tuple]" = OrderedDict()  # (query, top_k) -> (stored_at, chunks)
+_cache_lock = threading.Lock()
+
+
+def _normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive cache key (MiniLM's tokenizer is uncased anyway)."""
+    return " ".join(query.lower().split())
+
+
+def invalidate_cache():
+    """Drop every cached result — called whenever the index or chunk database (re)loads."""
+    with _cache_lock:
+        _cache.clear()
+
+
 def _retrieve_cached(query: str, top_k: int = 3) -> tuple:
     """
-    Cached wrapper around _run_retrieval.
-    Returns a tuple (not list) so lru_cache can store it safely —
-    tuples are immutable and hashable, lists are not.
+    Cached wrapper around _run_retrieval: bounded LRU with a TTL.
+    Returns a tuple (not list) so one cached value can be shared by every caller.
     """
-    return tuple(_run_retrieval(query, top_k))
+    query = _normalize_query(query)
+    key = (query, top_k)
+    now = time.monotonic()
+
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and now - entry[0] < CACHE_TTL_SECONDS:
+            _cache.move_to_end(key)
+            return entry[1]
+
+    # Search outside the lock — concurrent misses on one key just compute it twice
+    results = tuple(_run_retrieval(query, top_k))
+
+    with _cache_lock:
+        _cache[key] = (now, results)
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+
+    return results
 
 
 def retrieve_chunks(query: str, top_k: int = 3) -> list:
     """
     Public retrieval entry point (called by generate.py and the API layer).
-    - Repeated queries within the same session are served instantly from cache
-    - Returns a list of grounded chunk dicts, or [] if nothing meets the threshold
+    - Repeated queries (ignoring case/whitespace) are served from cache for CACHE_TTL_SECONDS
+    - Returns a list of grounded Chunk tuples, or [] if nothing meets the threshold
     - Downstream (generate.py) must treat an empty list as a fallback trigger
     """
     return list(_retrieve_cached(query, top_k))
 
+
+def retrieve_chunks_batch(queries: list, top_k: int = 3) -> list:
+    """
+    Retrieve for many queries at once (eval harness, bulk jobs): one batched encode
+    and one FAISS search for the whole list instead of a forward pass + search per
+    query. Returns one list of Chunk tuples per query, in input order, with the same
+    threshold filtering as retrieve_chunks. Bypasses the per-query cache.
+    """
+    if not queries:
+        return []
+
+    model, index, db = get_resources()
+
+    if index is None or db is None:
+        logger.warning("Search aborted: index or database not loaded")
+        return [[] for _ in queries]
+
+    start_time = time.perf_counter()
+
+    query_vectors = model.encode(
+        queries,
+        batch_size=min(64, len(queries)),
+        convert_to_numpy=True,
+        show_progress_bar=False
+    )
+    D, I = index.search(np.ascontiguousarray(query_vectors, dtype=np.float32), top_k)
+
+    results = [_to_chunks(D[q], I[q], db) for q in range(len(queries))]
+
+    latency_ms = (time.perf_counter() - start_time) * 1000
+    logger.info(
+        f"Batch-retrieved {len(queries)} queries | "
+        f"Latency: {latency_ms:.2f}ms | "
+        f"Hits: {sum(1 for r in results if r)}/{len(queries)}"
+    )
+
+    return results
+
+# LIVEWIRE_PRELOAD=1: load model, index and chunk DB at import so the first live
+# query doesn't pay the cold-start load
+if os.environ.get("LIVEWIRE_PRELOAD") == "1":
+    get_resources()
+
 # --- TEST BLOCK (Evidence Pack Generator) ---
 if __name__ == "__main__":
 
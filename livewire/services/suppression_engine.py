@@ -1,15 +1,36 @@
 import time
-from collections import defaultdict, deque
-from typing import Dict, List, Optional
+from collections import deque
+from typing import Dict, List, NamedTuple, Optional
 from datetime import datetime, timedelta
 
+class EvidenceEntry(NamedTuple):
+    """One evidence span that produced a shown card (tuple: no per-entry dict)."""
+    span: str
+    timestamp: float
+    card_type: str
+
+
+class _CooldownWindows(dict):
+    """Cooldown seconds per card type; unknown types read the current "default" entry
+    without being inserted, so the table never grows and tracks edits to "default"."""
+
+    def __missing__(self, card_type):
+        return self["default"]
+
+
 class SuppressionEngine:
+    # All timestamps are time.monotonic() seconds — windows are pure durations, and a
+    # wall-clock (NTP) step must not make elapsed times negative or skip a cooldown
     def __init__(self):
         self.handled_cards: Dict[str, float] = {}
         self.cooldowns: Dict[str, float] = {}
         self.evidence_history: deque = deque(maxlen=100)
+        # span -> timestamp of its newest entry in evidence_history; duplicate check
+        # is one dict lookup instead of a scan of the whole history
+        self._span_last_seen: Dict[str, float] = {}
         
-        self.COOLDOWN_WINDOWS = {
+        # Unknown card types fall back to the "default" window on plain subscript
+        self.COOLDOWN_WINDOWS = _CooldownWindows({
             "price": 300,
             "timing": 180,
             "features": 240,
@@ -17,12 +38,19 @@ class SuppressionEngine:
             "authority": 180,
             "trust": 240,
             "default": 180
-        }
+        })
         
         self.SUPPRESSION_WINDOW = 120
+        self.DUPLICATE_EVIDENCE_WINDOW = 30
+        
+        # Expired entries are harmless (every read re-checks age), so cleanup is
+        # amortised: every CLEANUP_EVERY marks, or sooner if handled_cards grows large
+        self.CLEANUP_EVERY = 32
+        self.CLEANUP_MAX_ENTRIES = 256
+        self._marks_since_cleanup = 0
     
     def should_show_card(self, card_type: str, evidence_span: str, card_id: str = None) -> dict:
-        current_time = time.time()
+        current_time = time.monotonic()
         
         handled_key = f"{card_type}:{evidence_span}"
         if handled_key in self.handled_cards:
@@ -37,7 +65,7 @@ class SuppressionEngine:
         
         if card_type in self.cooldowns:
             time_since_last = current_time - self.cooldowns[card_type]
-            cooldown_period = self.COOLDOWN_WINDOWS.get(card_type, self.COOLDOWN_WINDOWS["default"])
+            cooldown_period = self.COOLDOWN_WINDOWS[card_type]
             
             if time_since_last < cooldown_period:
                 return {
@@ -54,11 +82,14 @@ class SuppressionEngine:
                 "message": "Same evidence span triggered multiple cards"
             }
         
-        self.evidence_history.append({
-            "span": evidence_span,
-            "timestamp": current_time,
-            "card_type": card_type
-        })
+        if len(self.evidence_history) == self.evidence_history.maxlen:
+            # Oldest entry is about to be evicted — forget its span too if that entry
+            # was the span's newest, so the index never outlives the history
+            evicted = self.evidence_history[0]
+            if self._span_last_seen.get(evicted.span) == evicted.timestamp:
+                del self._span_last_seen[evicted.span]
+        self.evidence_history.append(EvidenceEntry(evidence_span, current_time, card_type))
+        self._span_last_seen[evidence_span] = current_time
         
         return {
             "show": True,
@@ -67,27 +98,24 @@ class SuppressionEngine:
         }
     
     def mark_handled(self, card_type: str, evidence_span: str):
-        current_time = time.time()
+        current_time = time.monotonic()
         handled_key = f"{card_type}:{evidence_span}"
         
         self.handled_cards[handled_key] = current_time
         self.cooldowns[card_type] = current_time
         
-        self._cleanup_old_entries()
+        self._marks_since_cleanup += 1
+        if (self._marks_since_cleanup >= self.CLEANUP_EVERY
+                or len(self.handled_cards) > self.CLEANUP_MAX_ENTRIES):
+            self._cleanup_old_entries()
+            self._marks_since_cleanup = 0
     
     def _is_duplicate_evidence(self, evidence_span: str) -> bool:
-        current_time = time.time()
-        recent_window = 30
-        
-        for entry in self.evidence_history:
-            if entry["span"] == evidence_span:
-                if current_time - entry["timestamp"] < recent_window:
-                    return True
-        
-        return False
+        last_seen = self._span_last_seen.get(evidence_span)
+        return last_seen is not None and time.monotonic() - last_seen < self.DUPLICATE_EVIDENCE_WINDOW
     
     def _cleanup_old_entries(self):
-        current_time = time.time()
+        current_time = time.monotonic()
         max_age = 600
         
         self.handled_cards = {
@@ -97,11 +125,16 @@ class SuppressionEngine:
         
         self.cooldowns = {
             k: v for k, v in self.cooldowns.items()
-            if current_time - v < self.COOLDOWN_WINDOWS.get(k, self.COOLDOWN_WINDOWS["default"])
+            if current_time - v < self.COOLDOWN_WINDOWS[k]
+        }
+        
+        self._span_last_seen = {
+            k: v for k, v in self._span_last_seen.items()
+            if current_time - v < self.DUPLICATE_EVIDENCE_WINDOW
         }
     
     def get_suppression_status(self) -> dict:
-        current_time = time.time()
+        current_time = time.monotonic()
         
         active_suppressions = []
         for key, timestamp in self.handled_cards.items():
@@ -114,7 +147,7 @@ class SuppressionEngine:
         
         active_cooldowns = []
         for card_type, timestamp in self.cooldowns.items():
-            cooldown_period = self.COOLDOWN_WINDOWS.get(card_type, self.COOLDOWN_WINDOWS["default"])
+            cooldown_period = self.COOLDOWN_WINDOWS[card_type]
             remaining = cooldown_period - (current_time - timestamp)
             if remaining > 0:
                 active_cooldowns.append({
@@ -132,3 +165,5 @@ class SuppressionEngine:
         self.handled_cards.clear()
         self.cooldowns.clear()
         self.evidence_history.clear()
+        self._span_last_seen.clear()
+        self._marks_since_cleanup = 0
@@ -0,0 +1,46 @@
+import os
+import shutil
+import tempfile
+import pytest
+
+# Set before any test module imports services.a365_integration: its module-level
+# tracker then opens its SQLite DB (and WAL files) here instead of in the cwd
+_IDEMPOTENCY_DIR = tempfile.mkdtemp(prefix="livewire-tests-")
+os.environ["LIVEWIRE_IDEMPOTENCY_DB"] = os.path.join(_IDEMPOTENCY_DIR, "idempotency.db")
+
+from services.guardrails import GuardrailEngine
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_IDEMPOTENCY_DIR, ignore_errors=True)
+
+class FakeClock:
+    """Virtual monotonic clock: call it for the current time, advance() to move it on.
+    sleep() doubles as an injectable blocking sleep: it records the delay and advances."""
+
+    def __init__(self, start: float = 1000.0):
+        self.now = start
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.advance(seconds)
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def guardrails(clock):
+    """Fresh GuardrailEngine on the virtual clock, debounce off (tests opt back in)."""
+    engine = GuardrailEngine(clock=clock)
+    engine.DEBOUNCE_SECONDS = 0
+    return engine
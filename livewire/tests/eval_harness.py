@@ -1,5 +1,5 @@
 import logging
-from services.retrieve import retrieve_chunks
+from services.retrieve import retrieve_chunks_batch
 from services.card_generator import generate_cards
 
 # --- CONFIGURATION ---
@@ -27,6 +27,55 @@ TEST_CASES = [
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+def run_case(case, chunks) -> dict:
+    """Generate cards for one test case from its retrieved chunks, then grade them."""
+    query = case["query"]
+
+    # --- Run pipeline ---
+    try:
+        cards = generate_cards(query, chunks)
+    except Exception as e:
+        logger.error(f"Generator exception for '{query}': {e}")
+        cards = []
+
+    # --- Analyze output ---
+    has_grounded = any(c.get("grounded") for c in cards)
+
+    # --- Grading ---
+    status = "FAIL"
+    if case["expect_hit"]:
+        if has_grounded:
+            status = "PASS"
+    else:
+        if not has_grounded:
+            status = "PASS"
+
+    # --- Hallucination / consistency checks ---
+    # All retrieved text joined once per query, so each card is one substring
+    # search instead of a scan over every chunk (NUL can't occur in snippets,
+    # so no match spans two chunks)
+    hallucinations = []
+    source_text = "\0".join(c.text_content for c in chunks)
+    for card in cards:
+        if card.get("grounded"):
+            # Missing source IDs
+            if not card.get("source_chunk_ids"):
+                hallucinations.append(f"🚨 HALLUCINATION: Grounded card missing source_chunk_ids for '{query}'")
+            # Check that card body exists in retrieved chunk
+            snippet = card.get("body", "")[:50]
+            found_in_source = snippet in source_text
+            if not found_in_source and chunks:
+                hallucinations.append(f"🚨 DATA MISMATCH: Card body not found in source text for '{query}'")
+
+    return {
+        "query": query,
+        "status": status,
+        "found": len(chunks),
+        "card_type": cards[0].get("type") if cards else "N/A",
+        "hallucinations": hallucinations,
+    }
+
+
 def run_evaluation():
     # Header for console output table
     print(f"{'QUERY':<50} | {'FOUND':<5} | {'TYPE':<15} | {'RESULT'}")
@@ -35,52 +84,25 @@ def run_evaluation():
     passed_tests = 0
     total_hallucinations = 0
 
+    # --- Retrieve every distinct query in one batch (single encode + FAISS search) ---
+    # Repeated queries are retrieved once and their chunks shared across cases
+    unique_queries = list(dict.fromkeys(case["query"] for case in TEST_CASES))
+    chunks_by_query = dict(zip(unique_queries, retrieve_chunks_batch(unique_queries)))
+
     for case in TEST_CASES:
-        query = case["query"]
-
-        # --- Run pipeline ---
-        chunks = retrieve_chunks(query)
-        try:
-            cards = generate_cards(query, chunks)
-        except Exception as e:
-            logger.error(f"Generator exception for '{query}': {e}")
-            cards = []
-
-        # --- Analyze output ---
-        has_grounded = any(c.get("grounded") for c in cards)
-        has_fallback = any(not c.get("grounded") for c in cards) or len(cards) == 0
-
-        # --- Grading ---
-        status = "FAIL"
-        if case["expect_hit"]:
-            if has_grounded:
-                status = "PASS"
-        else:
-            if not has_grounded:
-                status = "PASS"
-
-        if status == "PASS":
-            passed_tests += 1
+        result = run_case(case, chunks_by_query[case["query"]])
 
-        # --- Hallucination / consistency checks ---
-        for card in cards:
-            if card.get("grounded"):
-                # Missing source IDs
-                if not card.get("source_chunk_ids"):
-                    total_hallucinations += 1
-                    print(f"🚨 HALLUCINATION: Grounded card missing source_chunk_ids for '{query}'")
-                # Check that card body exists in retrieved chunk
-                snippet = card.get("body", "")[:50]
-                found_in_source = any(snippet in c.get("text_content", "") for c in chunks)
-                if not found_in_source and chunks:
-                    total_hallucinations += 1
-                    print(f"🚨 DATA MISMATCH: Card body not found in source text for '{query}'")
+        if result["status"] == "PASS":
+            passed_tests += 1
+        total_hallucinations += len(result["hallucinations"])
+        for message in result["hallucinations"]:
+            print(message)
 
         # --- Safe display for table ---
+        query = result["query"]
         query_display = query if len(query) <= 50 else query[:47] + "..."
-        card_type = cards[0].get("type") if cards else "N/A"
 
-        print(f"{query_display:<50} | {len(chunks):<5} | {card_type:<15} | {status}")
+        print(f"{query_display:<50} | {result['found']:<5} | {result['card_type']:<15} | {result['status']}")
 
     print("-" * 90)
     print(f"Final Score: {passed_tests}/{len(TEST_CASES)}")
@@ -1,65 +1,253 @@
+import asyncio
 import pytest
-from services.a365_integration import push_to_a365, push_to_a365_retry
-
-def test_push_basic():
-    result = push_to_a365(
-        summary="Customer mentioned budget concerns",
-        tasks=["Follow up with pricing options"],
-        tags=["pricing_objection"]
-    )
-    assert result["note"] == "Customer mentioned budget concerns"
-    assert len(result["action_items"]) == 1
-    assert result["categories"] == ["pricing_objection"]
-
-def test_push_empty_tasks():
-    result = push_to_a365(
-        summary="Test",
-        tasks=[],
-        tags=["test"]
-    )
-    assert result["action_items"] == []
-    assert result["note"] == "Test"
-
-def test_push_empty_tags():
-    result = push_to_a365(
-        summary="Test",
-        tasks=["Task 1"],
-        tags=[]
-    )
-    assert result["categories"] == []
-
-def test_push_long_summary():
-    long_text = "A" * 1000
-    result = push_to_a365(
-        summary=long_text,
-        tasks=[],
-        tags=[]
-    )
-    assert len(result["note"]) == 1000
-
-def test_push_special_characters():
-    result = push_to_a365(
-        summary="Test with special chars: @#$%^&*()",
-        tasks=["Task with 'quotes'"],
-        tags=["tag-with-dash"]
-    )
-    assert "@#$%^&*()" in result["note"]
-
-def test_push_timestamp_exists():
-    result = push_to_a365("Test", [], [])
-    assert "timestamp" in result
-    assert result["timestamp"] is not None
-
-def test_push_source_field():
-    result = push_to_a365("Test", [], [])
-    assert result["source"] == "livewire"
-
-def test_push_multiple_tasks():
-    tasks = ["Task 1", "Task 2", "Task 3"]
-    result = push_to_a365("Summary", tasks, [])
-    assert len(result["action_items"]) == 3
-
-def test_push_multiple_tags():
-    tags = ["tag1", "tag2", "tag3"]
-    result = push_to_a365("Summary", [], tags)
-    assert len(result["categories"]) == 3
\ No newline at end of file
+import uuid
+from functools import lru_cache
+from types import SimpleNamespace
+from services import a365_integration
+from services.a365_integration import push_to_a365, push_batch_to_a365
+from services.idempotency_tracker import IdempotencyTracker
+from services.rate_limit_handler import RateLimitHandler
+
+
+@pytest.fixture(scope="module", autouse=True)
+def isolated_tracker(tmp_path_factory):
+    """One temp-DB tracker for the module, swapped in for the shared module-level one
+    so this module's pushes start from an empty DB (conftest already points the
+    module-level tracker at a temp path rather than livewire_idempotency.db)."""
+    tracker = IdempotencyTracker(db_path=str(tmp_path_factory.mktemp("a365") / "idempotency.db"))
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(a365_integration, "_idempotency_tracker", tracker)
+        yield tracker
+    tracker.close()
+
+
+# (summary, tasks, tags, check on the pushed payload) — one row per push scenario
+PUSH_CASES = [
+    pytest.param(
+        "Customer mentioned budget concerns", ["Follow up with pricing options"], ["pricing_objection"],
+        lambda p: p["note"] == "Customer mentioned budget concerns"
+        and len(p["action_items"]) == 1
+        and p["categories"] == ["pricing_objection"],
+        id="basic"),
+    pytest.param(
+        "Test", [], ["test"],
+        lambda p: p["action_items"] == [] and p["note"] == "Test",
+        id="empty_tasks"),
+    pytest.param(
+        "Test", ["Task 1"], [],
+        lambda p: p["categories"] == [],
+        id="empty_tags"),
+    pytest.param(
+        "A" * 1000, [], [],
+        lambda p: len(p["note"]) == 1000,
+        id="long_summary"),
+    pytest.param(
+        "Test with special chars: @#$%^&*()", ["Task with 'quotes'"], ["tag-with-dash"],
+        lambda p: "@#$%^&*()" in p["note"],
+        id="special_characters"),
+    pytest.param(
+        "Test", [], [],
+        lambda p: "timestamp" in p and p["timestamp"] is not None,
+        id="timestamp_exists"),
+    pytest.param(
+        "Test", [], [],
+        lambda p: p["source"] == "livewire",
+        id="source_field"),
+    pytest.param(
+        "Summary", ["Task 1", "Task 2", "Task 3"], [],
+        lambda p: len(p["action_items"]) == 3,
+        id="multiple_tasks"),
+    pytest.param(
+        "Summary", [], ["tag1", "tag2", "tag3"],
+        lambda p: len(p["categories"]) == 3,
+        id="multiple_tags"),
+]
+
+@lru_cache(maxsize=None)
+def _pushed_payload(summary, tasks, tags):
+    """Payload for one (summary, tasks, tags) push, built once per distinct argument set
+    (timestamp_exists and source_field share the same push)."""
+    return push_to_a365(summary, list(tasks), list(tags))["payload"]
+
+@pytest.mark.parametrize("summary,tasks,tags,check", PUSH_CASES)
+def test_push(summary, tasks, tags, check):
+    assert check(_pushed_payload(summary, tuple(tasks), tuple(tags)))
+
+def test_push_batch_skips_duplicates_preflight():
+    session_id = f"sess_batch_{uuid.uuid4().hex[:8]}"
+    item = {
+        "session_id": session_id,
+        "contact_id": "contact_batch",
+        "summary": "Batch summary",
+        "tasks": ["Send pricing deck"],
+        "tags": ["price"],
+    }
+    other = dict(item, session_id=session_id + "_b")
+
+    results = push_batch_to_a365([item, dict(item), other])
+    assert [r["status"] for r in results] == ["success", "skipped", "success"]
+
+    again = push_batch_to_a365([item])
+    assert again[0]["status"] == "skipped"
+
+
+def test_push_batch_fails_items_on_malformed_bulk_response(isolated_tracker, monkeypatch):
+    """A list body from the bulk endpoint fails each item instead of raising."""
+    monkeypatch.setattr(a365_integration, "GHL_API_KEY", "test-key")
+    monkeypatch.setattr(a365_integration, "_post_batch",
+                        lambda payloads: {"status": "success", "status_code": 207,
+                                          "data": [{"contact_id": "contact_bulk", "status": 201}]})
+    session_id = f"sess_bad_bulk_{uuid.uuid4().hex[:8]}"
+    items = [
+        {"session_id": session_id + suffix, "contact_id": "contact_bulk", "summary": "Bulk summary",
+         "tasks": [], "tags": []}
+        for suffix in ("_a", "_b")
+    ]
+
+    results = push_batch_to_a365(items)
+
+    assert [r["status"] for r in results] == ["error", "error"]
+    for result in results:
+        row = isolated_tracker._conn.execute(
+            "SELECT status FROM crm_pushes WHERE dedupe_key = ?", (result["dedupe_key"],)
+        ).fetchone()
+        assert row == ("failed",)
+
+
+
+@pytest.fixture
+def bulk_posts(monkeypatch):
+    """
+    Live-key batch pushes against a scripted bulk endpoint: set `response` on the
+    returned namespace; every _post_batch call's payloads are appended to `calls`.
+    """
+    endpoint = SimpleNamespace(response=None, calls=[])
+
+    def fake_post_batch(payloads):
+        endpoint.calls.append(payloads)
+        return endpoint.response
+
+    monkeypatch.setattr(a365_integration, "GHL_API_KEY", "test-key")
+    monkeypatch.setattr(a365_integration, "_bulk_endpoint_unsupported", False)
+    monkeypatch.setattr(a365_integration, "_post_batch", fake_post_batch)
+    return endpoint
+
+
+def _batch_items(label, contact_ids):
+    session_id = f"sess_{label}_{uuid.uuid4().hex[:8]}"
+    return [
+        {"session_id": f"{session_id}_{i}", "contact_id": contact_id, "summary": "Bulk summary",
+         "tasks": [], "tags": []}
+        for i, contact_id in enumerate(contact_ids)
+    ]
+
+
+def test_push_batch_maps_bulk_results_by_contact(bulk_posts):
+    bulk_posts.response = {"status": "success", "status_code": 200, "data": {"results": [
+        {"contact_id": "contact_b", "status": 201, "id": "note_b"},
+        {"contact_id": "contact_a", "status": 201, "id": "note_a"},
+    ]}}
+
+    results = push_batch_to_a365(_batch_items("bulk_ok", ["contact_a", "contact_b"]))
+
+    assert [r["status"] for r in results] == ["success", "success"]
+    assert [r["data"]["data"]["id"] for r in results] == ["note_a", "note_b"]
+    assert len(bulk_posts.calls) == 1
+
+
+def test_push_batch_fails_only_the_rejected_item_of_a_207(bulk_posts, isolated_tracker):
+    bulk_posts.response = {"status": "success", "status_code": 207, "data": {"results": [
+        {"contact_id": "contact_a", "status": 201, "id": "note_a"},
+        {"contact_id": "contact_b", "status": 422, "error": "invalid contact"},
+    ]}}
+
+    results = push_batch_to_a365(_batch_items("bulk_207", ["contact_a", "contact_b"]))
+
+    assert [r["status"] for r in results] == ["success", "error"]
+    assert results[1]["error_type"] == "push_failed"
+    statuses = [
+        isolated_tracker._conn.execute(
+            "SELECT status FROM crm_pushes WHERE dedupe_key = ?", (r["dedupe_key"],)
+        ).fetchone()[0]
+        for r in results
+    ]
+    assert statuses == ["completed", "failed"]
+
+
+def test_push_batch_falls_back_and_remembers_missing_bulk_endpoint(bulk_posts, monkeypatch):
+    bulk_posts.response = {"status": "success", "unsupported": True}
+    pushed = []
+
+    def fake_push(summary, tasks, tags, contact_id=None):
+        pushed.append(contact_id)
+        return {"status": "success", "mock": True}
+
+    monkeypatch.setattr(a365_integration, "push_to_a365", fake_push)
+
+    first = push_batch_to_a365(_batch_items("bulk_404", ["contact_a", "contact_b"]))
+    second = push_batch_to_a365(_batch_items("bulk_404_again", ["contact_c"]))
+
+    assert [r["status"] for r in first + second] == ["success"] * 3
+    assert pushed == ["contact_a", "contact_b", "contact_c"]
+    assert len(bulk_posts.calls) == 1  # later batches skip the bulk POST
+
+
+_RATE_LIMITED = {"status_code": 429, "error": "Rate limit exceeded", "error_type": "rate_limit",
+                 "retry_after": None}
+
+
+@pytest.fixture
+def async_pushes(monkeypatch, clock):
+    """
+    Route push_to_a365_with_retry_async through scripted push_to_a365 results and a
+    rate limiter whose async backoff runs on the virtual clock. Returns the list of
+    results still to hand out (the last one repeats).
+    """
+    script = []
+
+    def scripted_push(summary, tasks, tags, contact_id=None):
+        return script.pop(0) if len(script) > 1 else script[0]
+
+    async def fake_async_sleep(delay):
+        clock.sleep(delay)
+
+    monkeypatch.setattr(a365_integration, "push_to_a365", scripted_push)
+    monkeypatch.setattr(a365_integration, "_rate_limiter", RateLimitHandler(
+        max_retries=3, base_delay=0.1, jitter="none",
+        sleep=clock.sleep, clock=clock, async_sleep=fake_async_sleep))
+    return script
+
+
+def _push_async(session_suffix):
+    return asyncio.run(a365_integration.push_to_a365_with_retry_async(
+        session_id=f"sess_async_{session_suffix}_{uuid.uuid4().hex[:8]}",
+        contact_id="contact_async",
+        summary="Async summary",
+        tasks=["Send pricing deck"],
+        tags=["price"],
+    ))
+
+
+def test_push_with_retry_async_recovers_after_429(async_pushes, clock):
+    async_pushes.extend([_RATE_LIMITED, {"status": "success", "mock": True}])
+
+    result = _push_async("recover")
+
+    assert result["status"] == "success"
+    assert result["attempts"] == 2
+    assert clock.sleeps == pytest.approx([0.1])
+
+
+def test_push_with_retry_async_gives_up_when_budget_spent(async_pushes, clock, isolated_tracker):
+    async_pushes.append(_RATE_LIMITED)
+
+    result = _push_async("exhausted")
+
+    assert result["status"] == "error"
+    assert result["error_type"] == "rate_limit_exceeded"
+    assert result["attempts"] == 3
+    assert clock.sleeps == pytest.approx([0.1, 0.2])
+    row = isolated_tracker._conn.execute(
+        "SELECT status FROM crm_pushes WHERE dedupe_key = ?", (result["dedupe_key"],)
+    ).fetchone()
+    assert row == ("failed",)
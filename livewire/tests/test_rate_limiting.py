@@ -3,20 +3,43 @@ WS5-2.4 Tests: Rate Limit Handling
 Tests verify backoff works and system recovers
 """
 
+import asyncio
 import pytest
+import random
 import time
-from services.rate_limit_handler import RateLimitHandler, mock_ghl_api_call
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from types import MappingProxyType
+from services.rate_limit_handler import RateLimitHandler, SlidingWindowLimiter, mock_ghl_api_call, parse_retry_after
+
+# Shared read-only payload: a handler that mutated it would raise TypeError
+_PAYLOAD = MappingProxyType({"note": "Test"})
 
 
 class TestRateLimitHandler:
     
-    def setup_method(self):
-        self.handler = RateLimitHandler(max_retries=5, base_delay=0.1)
+    @pytest.fixture(autouse=True)
+    def virtual_time(self, clock):
+        # Virtual time: backoff sleeps are recorded and advance the fake clock instead
+        # of blocking. No jitter, so recorded delays follow the raw exponential schedule
+        self.sleeps = clock.sleeps
+        
+        async def fake_async_sleep(delay):
+            clock.sleep(delay)
+            await asyncio.sleep(0)  # still yield to the loop, as a real wait would
+        
+        self.handler = RateLimitHandler(max_retries=5, base_delay=0.1, jitter="none",
+                                        sleep=clock.sleep, clock=clock,
+                                        async_sleep=fake_async_sleep)
+    
+    def real_time_handler(self):
+        """Handler that really sleeps, for the tests that measure wall-clock delays"""
+        return RateLimitHandler(max_retries=5, base_delay=0.1, jitter="none")
     
     def test_successful_call_no_retry(self):
         result = self.handler.execute_with_backoff(
             mock_ghl_api_call,
-            {"note": "Test"},
+            _PAYLOAD,
             fail_mode=None
         )
         
@@ -25,68 +48,71 @@ class TestRateLimitHandler:
     
     def test_rate_limit_triggers_backoff(self):
         """DoD: Simulated rate limit triggers backoff"""
-        call_count = [0]
+        call_count = 0
         
         def rate_limit_twice_then_success(payload, fail_mode=None):
-            call_count[0] += 1
-            if call_count[0] <= 2:
+            nonlocal call_count
+            call_count += 1
+            if call_count <= 2:
                 return mock_ghl_api_call(payload, "rate_limit")
             return mock_ghl_api_call(payload, None)
         
-        start_time = time.time()
         result = self.handler.execute_with_backoff(
             rate_limit_twice_then_success,
-            {"note": "Test"}
+            _PAYLOAD
         )
-        elapsed = time.time() - start_time
         
         assert result["status"] == "success"
         assert result["attempts"] == 3
-        assert elapsed > 0.3
+        assert self.sleeps == pytest.approx([0.1, 0.2], rel=0.01)
         
         stats = self.handler.get_stats()
         assert stats["total_rate_limit_hits"] >= 2
     
     def test_system_recovers_after_rate_limit(self):
         """DoD: System recovers after rate limit"""
-        call_count = [0]
+        call_count = 0
         
         def rate_limit_then_success(payload, fail_mode=None):
-            call_count[0] += 1
-            if call_count[0] == 1:
+            nonlocal call_count
+            call_count += 1
+            if call_count == 1:
                 return mock_ghl_api_call(payload, "rate_limit")
             return mock_ghl_api_call(payload, None)
         
         result = self.handler.execute_with_backoff(
             rate_limit_then_success,
-            {"note": "Test"}
+            _PAYLOAD
         )
         
         assert result["status"] == "success"
-        assert call_count[0] == 2
+        assert call_count == 2
     
     def test_max_retries_exhausted(self):
         result = self.handler.execute_with_backoff(
             mock_ghl_api_call,
-            {"note": "Test"},
+            _PAYLOAD,
             fail_mode="rate_limit"
         )
         
         assert result["status"] == "rate_limit_exceeded"
         assert result["attempts"] == self.handler.max_retries
     
+    @pytest.mark.slow
     def test_exponential_backoff_timing(self):
-        call_count = [0]
+        call_count = 0
         call_times = []
         
         def always_rate_limit(payload, fail_mode=None):
-            call_count[0] += 1
-            call_times.append(time.time())
+            nonlocal call_count
+            call_count += 1
+            if len(call_times) < 3:  # only the first two gaps are compared
+                call_times.append(time.monotonic())
             return mock_ghl_api_call(payload, "rate_limit")
         
-        self.handler.execute_with_backoff(
+        self.real_time_handler().execute_with_backoff(
             always_rate_limit,
-            {"note": "Test"}
+            _PAYLOAD
         )
         
         if len(call_times) >= 3:
@@ -96,37 +122,32 @@ class TestRateLimitHandler:
     
     def test_no_task_storm(self):
         """DoD: No task storms - max retries limit prevents infinite retries"""
-        call_count = [0]
+        call_count = 0
         
         def always_fail(payload, fail_mode=None):
-            call_count[0] += 1
+            nonlocal call_count
+            call_count += 1
             return mock_ghl_api_call(payload, "rate_limit")
         
         result = self.handler.execute_with_backoff(
             always_fail,
-            {"note": "Test"}
+            _PAYLOAD
         )
         
-        assert call_count[0] == self.handler.max_retries
-        assert call_count[0] <= 10
+        assert call_count == self.handler.max_retries
+        assert call_count <= 10
     
-    def test_stats_tracking(self):
+    def test_stats_and_reset(self):
+        # One exhausted run feeds both the stats and the reset assertions
         self.handler.execute_with_backoff(
             mock_ghl_api_call,
-            {"note": "Test"},
+            _PAYLOAD,
             fail_mode="rate_limit"
         )
         
         stats = self.handler.get_stats()
         assert stats["total_rate_limit_hits"] > 0
         assert stats["last_rate_limit"] is not None
-    
-    def test_reset_clears_state(self):
-        self.handler.execute_with_backoff(
-            mock_ghl_api_call,
-            {"note": "Test"},
-            fail_mode="rate_limit"
-        )
         
         self.handler.reset()
         stats = self.handler.get_stats()
@@ -134,6 +155,209 @@ class TestRateLimitHandler:
         assert stats["total_rate_limit_hits"] == 0
         assert stats["last_rate_limit"] is None
 
+    
+    def test_retry_after_overrides_backoff(self):
+        """A server-advertised Retry-After replaces the exponential schedule"""
+        call_count = 0
+        
+        def rate_limit_with_retry_after(payload):
+            nonlocal call_count
+            call_count += 1
+            if call_count == 1:
+                return mock_ghl_api_call(payload, "rate_limit", retry_after=0.05)
+            return mock_ghl_api_call(payload, None)
+        
+        result = self.handler.execute_with_backoff(rate_limit_with_retry_after, _PAYLOAD)
+        
+        assert result["status"] == "success"
+        assert self.sleeps == pytest.approx([0.05])  # not the 0.1s first backoff step
+        assert self.handler.get_stats()["current_backoff"] == 0.05
+    
+    def test_full_jitter_stays_within_capped_schedule(self):
+        handler = RateLimitHandler(base_delay=1.0, jitter="full", rng=random.Random(42))
+        
+        delays = [handler._calculate_backoff(attempt) for attempt in range(1, 9)]
+        
+        for attempt, delay in enumerate(delays, start=1):
+            assert 0 <= delay <= min(2 ** (attempt - 1), 60.0)
+        assert delays != [min(2 ** (a - 1), 60.0) for a in range(1, 9)]
+    
+    def test_equal_jitter_keeps_half_delay_floor(self):
+        handler = RateLimitHandler(base_delay=1.0, jitter="equal", rng=random.Random(7))
+        
+        for attempt in range(1, 9):
+            capped = min(2 ** (attempt - 1), 60.0)
+            assert capped / 2 <= handler._calculate_backoff(attempt) <= capped
+    
+    def test_errors_back_off_on_shorter_schedule_than_rate_limits(self):
+        handler = RateLimitHandler(base_delay=1.0, error_base_delay=0.2, jitter="none")
+        
+        assert handler._calculate_backoff(1, "error") == 0.2
+        assert handler._calculate_backoff(1, "rate_limit") == 1.0
+        assert handler._calculate_backoff(10, "error") == RateLimitHandler.ERROR_MAX_DELAY
+        assert handler._calculate_backoff(10, "rate_limit") == RateLimitHandler.RATE_LIMIT_MAX_DELAY
+    
+    def test_backoff_runs_on_injected_sleep(self):
+        """Sync retries wait through the injected sleep — no real time passes"""
+        start_time = time.time()
+        result = self.handler.execute_with_backoff(
+            mock_ghl_api_call,
+            _PAYLOAD,
+            fail_mode="rate_limit"
+        )
+        
+        assert result["status"] == "rate_limit_exceeded"
+        assert self.sleeps == pytest.approx([0.1, 0.2, 0.4, 0.8])
+        assert self.handler.get_stats()["recent_hits_5min"] == 5
+        assert time.time() - start_time < 0.5
+    
+    def test_unknown_jitter_mode_rejected(self):
+        with pytest.raises(ValueError):
+            RateLimitHandler(jitter="random")
+    
+    def test_retry_after_gets_small_jitter(self):
+        handler = RateLimitHandler(jitter="full", rng=random.Random(3))
+        
+        for _ in range(20):
+            delay = handler._rate_limit_delay({"retry_after": 2.0}, attempt=1)
+            assert 2.0 <= delay <= 2.2
+    
+    def test_long_retry_after_is_not_capped_by_backoff_limit(self):
+        """Retry-After: 120 is honoured in full, jitter added on top of it"""
+        call_count = 0
+        
+        def rate_limit_with_long_retry_after(payload):
+            nonlocal call_count
+            call_count += 1
+            if call_count == 1:
+                return mock_ghl_api_call(payload, "rate_limit", retry_after=120)
+            return mock_ghl_api_call(payload, None)
+        
+        result = self.handler.execute_with_backoff(rate_limit_with_long_retry_after, _PAYLOAD)
+        
+        assert result["status"] == "success"
+        assert self.sleeps == [120.0]
+        
+        jittered = RateLimitHandler(jitter="full", rng=random.Random(5))
+        for _ in range(20):
+            assert 120.0 <= jittered._rate_limit_delay({"retry_after": 120}, attempt=1) <= 121.0
+    
+    def test_parse_retry_after_seconds_and_http_date(self):
+        retry_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+        
+        assert parse_retry_after("120") == 120.0
+        assert 25 < parse_retry_after(format_datetime(retry_at, usegmt=True)) <= 30
+        assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+        assert parse_retry_after("soon") is None
+        assert parse_retry_after(None) is None
+    
+    def test_async_rate_limit_recovers(self):
+        call_count = 0
+        
+        async def rate_limit_once_then_success(payload):
+            nonlocal call_count
+            call_count += 1
+            if call_count == 1:
+                return mock_ghl_api_call(payload, "rate_limit")
+            return mock_ghl_api_call(payload, None)
+        
+        result = asyncio.run(self.handler.execute_with_backoff_async(
+            rate_limit_once_then_success,
+            _PAYLOAD
+        ))
+        
+        assert result["status"] == "success"
+        assert result["attempts"] == 2
+    
+    def test_async_backoff_does_not_block_event_loop(self):
+        """Other coroutines keep running while one push waits out its backoff"""
+        ticks = []
+        
+        async def ticker():
+            for _ in range(3):
+                ticks.append(len(self.sleeps))
+                await asyncio.sleep(0)
+        
+        async def run():
+            await asyncio.gather(
+                self.handler.execute_with_backoff_async(
+                    mock_ghl_api_call, _PAYLOAD, fail_mode="rate_limit"
+                ),
+                ticker(),
+            )
+        
+        asyncio.run(run())
+        
+        assert self.sleeps == pytest.approx([0.1, 0.2, 0.4, 0.8])
+        # The ticker ran before the backoff schedule finished, not after it
+        assert len(ticks) == 3
+        assert ticks[0] < len(self.sleeps)
+    
+    def test_async_runs_blocking_callable_off_the_loop(self):
+        """A plain (sync) callable runs in a worker thread, not on the event loop"""
+        ticks = []
+        
+        def slow_sync_call(payload):
+            time.sleep(0.1)
+            return mock_ghl_api_call(payload, None)
+        
+        async def ticker():
+            for _ in range(3):
+                ticks.append(time.time())
+                await asyncio.sleep(0.01)
+        
+        async def run():
+            results = await asyncio.gather(
+                self.handler.execute_with_backoff_async(slow_sync_call, _PAYLOAD),
+                ticker(),
+            )
+            return results[0]
+        
+        start_time = time.time()
+        result = asyncio.run(run())
+        
+        assert result["status"] == "success"
+        assert ticks[-1] - start_time < 0.1
+
+
+class TestSlidingWindowLimiter:
+    
+    @pytest.fixture(autouse=True)
+    def virtual_time(self, clock):
+        # Same virtual time as TestRateLimitHandler: pacing sleeps are recorded, not slept
+        self.clock = clock
+        self.sleeps = clock.sleeps
+    
+    def limiter(self, max_requests, period):
+        return SlidingWindowLimiter(max_requests=max_requests, period=period,
+                                    sleep=self.clock.sleep, clock=self.clock)
+    
+    def test_burst_within_quota_does_not_wait(self):
+        limiter = self.limiter(max_requests=3, period=10.0)
+        
+        for _ in range(3):
+            limiter.acquire()
+        
+        assert self.sleeps == []
+    
+    def test_request_over_quota_is_paced(self):
+        """Calls beyond the quota wait for the window instead of hitting a 429"""
+        limiter = self.limiter(max_requests=2, period=0.2)
+        
+        for _ in range(3):
+            limiter.acquire()
+        
+        assert self.sleeps == pytest.approx([0.2])
+    
+    def test_reset_frees_slots(self):
+        limiter = self.limiter(max_requests=1, period=10.0)
+        limiter.acquire()
+        limiter.reset()
+        
+        limiter.acquire()
+        
+        assert self.sleeps == []
+
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
\ No newline at end of file
@@ -46,7 +46,9 @@ def valid_payload():
 def tracker(tmp_path):
     """Fresh IdempotencyTracker backed by a temp DB for each test."""
     db_file = str(tmp_path / "test_idempotency.db")
-    return IdempotencyTracker(db_path=db_file)
+    tracker = IdempotencyTracker(db_path=db_file)
+    yield tracker
+    tracker.close()  # release the long-lived connection (and WAL files) before tmp cleanup
 
 
 # ══════════════════════════════════════════════════════════════════════════════
@@ -223,7 +225,7 @@ class TestIdempotencyKeyGeneration:
 
     def test_key_is_fixed_length_hex(self, valid_payload):
         key = generate_idempotency_key("sess_001", "full_push", valid_payload)
-        assert len(key) == 64  # SHA-256 hex digest
+        assert len(key) == 64  # 256-bit hex digest
         assert all(c in "0123456789abcdef" for c in key)
 
     def test_timestamp_excluded_from_hash(self, valid_payload):
@@ -442,4 +444,55 @@ class TestEdgeCases:
         conn.close()
         assert rows == 1
 
+    def test_legacy_sha256_row_still_detected_as_duplicate(self, tracker, valid_payload):
+        """Rows stored before the BLAKE2b switch must not read as payload_changed."""
+        import hashlib
+        import json
+        import sqlite3
+
+        dedupe_key = tracker.generate_dedupe_key("sess_legacy", "full_push", "art_legacy")
+        tracker.record_attempt(dedupe_key, "sess_legacy", "full_push", "art_legacy", valid_payload)
+        tracker.mark_completed(dedupe_key)
+
+        legacy_hash = hashlib.sha256(json.dumps(valid_payload, sort_keys=True).encode()).hexdigest()
+        conn = sqlite3.connect(tracker.db_path)
+        conn.execute(
+            "UPDATE crm_pushes SET payload_hash = ? WHERE dedupe_key = ?",
+            (legacy_hash, dedupe_key)
+        )
+        conn.commit()
+        conn.close()
+
+        check = tracker.check_duplicate(dedupe_key, valid_payload)
+        assert check["duplicate"] is True
+
+        changed = dict(valid_payload, summary="Different summary entirely.")
+        assert tracker.check_duplicate(dedupe_key, changed)["reason"] == "payload_changed"
+
+    def test_reopened_tracker_still_detects_duplicate(self, tracker, valid_payload):
+        """Keys persisted by an earlier tracker must still be found by a new one."""
+        dedupe_key = tracker.generate_dedupe_key("sess_reopen", "full_push", "art_reopen")
+        tracker.record_attempt(dedupe_key, "sess_reopen", "full_push", "art_reopen", valid_payload)
+        tracker.mark_completed(dedupe_key)
 
+        reopened = IdempotencyTracker(db_path=tracker.db_path)
+        try:
+            check = reopened.check_duplicate(dedupe_key, valid_payload)
+            assert check is not None
+            assert check["duplicate"] is True
+        finally:
+            reopened.close()
+
+    def test_concurrent_tracker_sees_later_completions(self, tracker, valid_payload):
+        """A tracker opened first must see keys another tracker completes afterwards."""
+        other = IdempotencyTracker(db_path=tracker.db_path)
+        try:
+            dedupe_key = tracker.generate_dedupe_key("sess_shared", "full_push", "art_shared")
+            tracker.record_attempt(dedupe_key, "sess_shared", "full_push", "art_shared", valid_payload)
+            tracker.mark_completed(dedupe_key)
+
+            check = other.check_duplicate(dedupe_key, valid_payload)
+            assert check is not None
+            assert check["duplicate"] is True
+        finally:
+            other.close()
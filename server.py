@@ -305,8 +305,10 @@ async def process_buffer(sess, ws=None):
             if os.path.exists(f): os.remove(f)
         except: pass
 
+    # Two writes rather than header + buffer — avoids copying the whole batch into a new bytes object
     with open(tmp_webm, "wb") as f:
-        f.write(header + sess["_buffer"])
+        f.write(header)
+        f.write(sess["_buffer"])
     sess["_buffer"] = bytearray()
 
     cmd = ['ffmpeg', '-y', '-i', tmp_webm, '-filter_complex',